@@ -0,0 +1,164 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.http import HttpResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound, ParseError
+
+from core.parsers import loads
+from core.renderers import ORJSONRenderer
+
+from . import serializers
+from .authentication import CachedJWTAuthentication
+from .cache import invalidate_user_snapshot
+from .hashing import amake_password
+from .models import Profile
+from .pagination import ProfileCursorPagination
+from .search import update_search_vectors
+from .tokens import RefreshToken
+
+
+User = get_user_model()
+
+
+class AsyncAPIView(View):
+    """
+    Base for the async (ASGI) account views: parses JSON bodies, runs JWT
+    authentication off the event loop and renders DRF exceptions the way
+    DRF does. Views run natively on the event loop under ASGI.
+    """
+    authentication_required = False
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        # authentication is by JWT, not session cookies, so like DRF's APIView
+        # the views are exempt from CSRF checks (csrf_exempt() would hide the
+        # coroutine function from Django 4.1)
+        view.csrf_exempt = True
+        return view
+
+    async def dispatch(self, request, *args, **kwargs):
+        try:
+            request.data = self.parse(request)
+            if self.authentication_required:
+                request.user = await self.authenticate(request)
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as exc:
+            detail = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+            return self.respond(detail, status=exc.status_code)
+
+    def parse(self, request):
+        if not request.body:
+            return {}
+        return loads(request.body, request.encoding or settings.DEFAULT_CHARSET)
+
+    async def authenticate(self, request):
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+        if result is None:
+            raise NotAuthenticated()
+        return result[0]
+
+    def respond(self, data, status=200):
+        return HttpResponse(ORJSONRenderer().render(data), status=status, content_type='application/json')
+
+
+class RegistrationView(AsyncAPIView):
+
+    async def post(self, request):
+        if request.data.get('is_mentor'):
+            serializer = serializers.MentorRegistrationSerializer(data=request.data)
+        else:
+            serializer = serializers.RegistrationSerializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        password_hash = await amake_password(serializer.validated_data['password'])
+        await sync_to_async(serializer.save)(password_hash=password_hash)
+        return self.respond({'message': 'Аккаунт успешно создан. Ожидайте письма с подтверждением регистрации'})
+
+
+class ActivationView(AsyncAPIView):
+
+    async def get(self, request, email, activation_code):
+        user_id = await User.objects.filter(
+            email=email, activation_code=activation_code).values_list('id', flat=True).afirst()
+        if user_id is None:
+            return self.respond('Пользователь не найден', status=400)
+        await User.objects.filter(pk=user_id).aupdate(
+            activation_code='', is_active=True, updated_at=timezone.now())
+        await sync_to_async(invalidate_user_snapshot)(user_id)
+        await sync_to_async(update_search_vectors)(
+            User.objects.filter(pk=user_id, is_mentor=True))
+        return self.respond('Активирован')
+
+
+class ForgotPasswordView(AsyncAPIView):
+    authentication_required = True
+
+    async def post(self, request):
+        serializer = serializers.ForgotPasswordSerializer(data=request.data)
+        await sync_to_async(serializer.is_valid)(raise_exception=True)
+        await sync_to_async(serializer.send_verification_email)()
+        return self.respond('Вам выслали сообщение для восстановления пароля')
+
+
+class APILogoutView(AsyncAPIView):
+    authentication_required = True
+
+    async def post(self, request):
+        if request.data.get('all'):
+            await User.objects.filter(pk=request.user.pk).aupdate(
+                token_generation=F('token_generation') + 1)
+            await sync_to_async(invalidate_user_snapshot)(request.user.pk)
+            return self.respond("Refresh token in backlist")
+        await sync_to_async(blacklist)(request.data.get('refresh_token'))
+        return self.respond('Всего доброго!')
+
+
+def blacklist(refresh_token):
+    RefreshToken(token=refresh_token).blacklist()
+
+
+def profile_fieldset(request):
+    serializer = serializers.ProfileFieldsetSerializer(data=request.GET)
+    serializer.is_valid(raise_exception=True)
+    return serializer.validated_data['fields']
+
+
+class ProfileListView(AsyncAPIView):
+    """Keyset-paginated profile list: ?after=<last id>&page_size=<n>."""
+
+    async def get(self, request):
+        try:
+            after = int(request.GET.get('after', 0))
+            page_size = min(
+                int(request.GET.get('page_size', ProfileCursorPagination.page_size)),
+                ProfileCursorPagination.max_page_size)
+        except ValueError:
+            raise ParseError('after and page_size must be integers')
+        fieldset = profile_fieldset(request)
+        profiles = [
+            profile async for profile in
+            Profile.objects.filter(id__gt=after).order_by('id')
+            .values(*serializers.ProfileReadSerializer.values_fields(fieldset))[:page_size]
+        ]
+        data = serializers.ProfileReadSerializer(
+            profiles, many=True, fields=fieldset, context={'request': request}).data
+        return self.respond({
+            'results': data,
+            'after': profiles[-1]['id'] if len(profiles) == page_size else None,
+        })
+
+
+class ProfileDetailView(AsyncAPIView):
+
+    async def get(self, request, pk):
+        fieldset = profile_fieldset(request)
+        try:
+            profile = await Profile.objects.values(
+                *serializers.ProfileReadSerializer.values_fields(fieldset)).aget(pk=pk)
+        except Profile.DoesNotExist:
+            raise NotFound()
+        return self.respond(serializers.ProfileReadSerializer(
+            profile, fields=fieldset, context={'request': request}).data)
@@ -0,0 +1,76 @@
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS
+from django.utils.translation import gettext_lazy as _
+from redis import RedisError
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import USER_SNAPSHOT_KEY, user_snapshots
+from .tokens import is_token_revoked
+from .utils import redis_client
+
+
+User = get_user_model()
+
+SNAPSHOT_FIELDS = ('id', 'username', 'is_active', 'is_staff', 'is_mentor', 'token_generation')
+
+
+def get_user_snapshot(user_id):
+    snapshot = user_snapshots.get(user_id)
+    if snapshot is not None:
+        return snapshot
+    key = USER_SNAPSHOT_KEY.format(user_id)
+    try:
+        cached = redis_client.get(key)
+    except RedisError:
+        cached = None
+    if cached is not None:
+        snapshot = json.loads(cached)
+    else:
+        snapshot = User.objects.filter(id=user_id).values(*SNAPSHOT_FIELDS).first()
+        if snapshot is None:
+            return None
+        try:
+            redis_client.set(key, json.dumps(snapshot), ex=settings.USER_CACHE_TTL)
+        except RedisError:
+            pass
+    user_snapshots.set(user_id, snapshot)
+    return snapshot
+
+
+def user_from_snapshot(snapshot):
+    """
+    Builds a User whose non-snapshot fields are deferred, so they are
+    loaded from the database only when a view actually touches them.
+    """
+    field_names = [f.attname for f in User._meta.concrete_fields if f.attname in snapshot]
+    return User.from_db(DEFAULT_DB_ALIAS, field_names, [snapshot[name] for name in field_names])
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication resolving the user from a slim snapshot cached in
+    process memory and in Redis instead of loading the row on every request.
+    Snapshots are dropped on User save/delete; other processes pick up the
+    change once their local entry expires (USER_CACHE_LOCAL_TTL).
+    """
+
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        snapshot = get_user_snapshot(user_id)
+        if snapshot is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+        if not snapshot['is_active']:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+        if is_token_revoked(validated_token, snapshot['token_generation']):
+            raise AuthenticationFailed('Токен отозван', code='token_revoked')
+        return user_from_snapshot(snapshot)
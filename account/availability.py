@@ -0,0 +1,181 @@
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from redis import RedisError
+
+from .utils import redis_client
+
+
+FILTER_KEY = 'availability:bloom'
+BUILDING_KEY = 'availability:bloom:building'
+REBUILD_LOCK_KEY = 'availability:bloom:rebuilding'
+FIELDS = ('username', 'email', 'slug')
+
+# Sets the bits only on a built filter: bits set on a missing key would make
+# a near-empty filter that reports everything else as free.
+ADD_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for _, offset in ipairs(ARGV) do
+    redis.call('SETBIT', KEYS[1], offset, 1)
+end
+return 1
+"""
+
+
+def get_availability_filter():
+    return _filter(settings.AVAILABILITY_FILTER)
+
+
+@lru_cache(maxsize=None)
+def _filter(path):
+    return import_string(path)()
+
+
+def _items(username, email, slug):
+    return [f'username:{username}', f'email:{email}', f'slug:{slug}']
+
+
+class BloomFilter:
+    """
+    Bit array sized for AVAILABILITY_FILTER_CAPACITY items at
+    AVAILABILITY_FILTER_ERROR_RATE false positives. Bits are numbered like
+    Redis SETBIT offsets (most significant bit of byte 0 first), so an
+    array built in memory can be stored in Redis as is.
+    """
+
+    def __init__(self):
+        capacity = settings.AVAILABILITY_FILTER_CAPACITY
+        error_rate = settings.AVAILABILITY_FILTER_ERROR_RATE
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+
+    def positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'big'), int.from_bytes(digest[8:], 'big')
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def build(self, items):
+        bits = bytearray((self.num_bits + 7) // 8)
+        for item in items:
+            for position in self.positions(item):
+                bits[position >> 3] |= 0x80 >> (position & 7)
+        return bits
+
+    def taken_items(self, since=None):
+        users = get_user_model().objects.all()
+        if since is not None:
+            users = users.filter(updated_at__gte=since)
+        for row in users.values_list(*FIELDS).iterator(chunk_size=settings.EXPORT_CHUNK_SIZE):
+            yield from _items(*row)
+
+
+class LocalBloomFilter(BloomFilter):
+    """
+    Filter in process memory, built on first use. Only sees users saved by
+    its own process, so it suits single-process deployments and tests.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.bits = None
+        self._lock = threading.Lock()
+
+    def rebuild(self):
+        bits = self.build(self.taken_items())
+        with self._lock:
+            self.bits = bits
+
+    def add(self, items):
+        with self._lock:
+            if self.bits is None:
+                return
+            for item in items:
+                for position in self.positions(item):
+                    self.bits[position >> 3] |= 0x80 >> (position & 7)
+
+    def might_contain(self, item):
+        if self.bits is None:
+            self.rebuild()
+        return all(self.bits[position >> 3] & (0x80 >> (position & 7)) for position in self.positions(item))
+
+
+class RedisBloomFilter(BloomFilter):
+    """
+    Filter shared by all processes as a Redis bitmap. might_contain()
+    returns None while the filter is not built; rebuild() runs in Celery.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._add = redis_client.register_script(ADD_SCRIPT)
+
+    def rebuild(self):
+        started = timezone.now()
+        try:
+            redis_client.set(BUILDING_KEY, bytes(self.build(self.taken_items())))
+            redis_client.rename(BUILDING_KEY, FILTER_KEY)
+            # users saved while the table was being read
+            self.add(list(self.taken_items(since=started - timedelta(seconds=5))))
+        finally:
+            redis_client.delete(REBUILD_LOCK_KEY)
+
+    def add(self, items):
+        positions = [position for item in items for position in self.positions(item)]
+        if positions:
+            self._add(keys=[FILTER_KEY], args=positions)
+
+    def might_contain(self, item):
+        with redis_client.pipeline(transaction=False) as pipe:
+            pipe.exists(FILTER_KEY)
+            for position in self.positions(item):
+                pipe.getbit(FILTER_KEY, position)
+            exists, *bits = pipe.execute()
+        if not exists:
+            self.schedule_rebuild()
+            return None
+        return all(bits)
+
+    def schedule_rebuild(self):
+        if redis_client.set(REBUILD_LOCK_KEY, time.time(), nx=True, ex=600):
+            from .tasks import rebuild_availability_filter
+            rebuild_availability_filter.delay()
+
+
+def add_user(user):
+    """Marks the user's username, email and slug as taken."""
+    add_users([user])
+
+
+def add_users(users):
+    items = [item for user in users for item in _items(user.username, user.email, user.slug)]
+    try:
+        get_availability_filter().add(items)
+    except RedisError:
+        # until the next rebuild these may read as free; registration still
+        # enforces uniqueness
+        pass
+
+
+def is_taken(field, value):
+    """
+    The filter answers "definitely free" without touching the database;
+    possible positives, and every check while the filter is unavailable,
+    go to the unique index.
+    """
+    try:
+        maybe_taken = get_availability_filter().might_contain(f'{field}:{value}')
+    except RedisError:
+        maybe_taken = None
+    if maybe_taken is False:
+        return False
+    return get_user_model().objects.filter(**{field: value}).exists()
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+
+from . import hashing
+
+
+User = get_user_model()
+
+
+class HashingPoolBackend(ModelBackend):
+    """
+    ModelBackend checking passwords in the hashing process pool. Hashes made
+    by an older hasher or with an outdated cost are replaced on login.
+    """
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        if username is None:
+            username = kwargs.get(User.USERNAME_FIELD)
+        if username is None or password is None:
+            return None
+        try:
+            user = User._default_manager.get_by_natural_key(username)
+        except User.DoesNotExist:
+            # hash anyway, so response time does not tell which usernames exist
+            hashing.make_password(password)
+            return None
+        valid, upgraded = hashing.verify(password, user.password)
+        if not valid:
+            return None
+        if upgraded:
+            # compare-and-set, a concurrent password change wins
+            User.objects.filter(pk=user.pk, password=user.password).update(password=upgraded)
+            user.password = upgraded
+        if self.user_can_authenticate(user):
+            return user
+        return None
@@ -0,0 +1,147 @@
+import threading
+import time
+from collections import OrderedDict
+from uuid import uuid4
+
+from django.conf import settings
+from django.core.cache import cache
+from redis import RedisError
+
+from core.db.router import replica_reads
+from .utils import redis_client
+
+
+USER_SNAPSHOT_KEY = 'user:snapshot:{}'
+PROFILE_VERSION_KEY = 'profile:{}:version'
+PROFILE_KEY = 'profile:{}:{}:{}'
+PROFILE_LOCK_KEY = 'profile:{}:{}:{}:lock'
+PROFILE_OWNER_KEY = 'profile:owner:{}'
+
+
+class LocalLRUCache:
+    """Small thread-safe in-process LRU cache whose entries expire after `ttl` seconds."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+user_snapshots = LocalLRUCache(settings.USER_CACHE_LOCAL_SIZE, settings.USER_CACHE_LOCAL_TTL)
+
+
+def invalidate_user_snapshot(user_id):
+    user_snapshots.delete(user_id)
+    try:
+        redis_client.delete(USER_SNAPSHOT_KEY.format(user_id))
+    except RedisError:
+        pass
+
+
+def profile_version(profile_id, create=True):
+    """
+    Returns the current cache version of a profile, which is also its ETag,
+    or None when the cache is unavailable. A missing version is started
+    unless `create` is false; only do that for a profile known to exist.
+    """
+    key = PROFILE_VERSION_KEY.format(profile_id)
+    try:
+        version = cache.get(key)
+        if version is None and create:
+            version = uuid4().hex
+            if not cache.add(key, version, timeout=settings.PROFILE_VERSION_TTL):
+                version = cache.get(key) or version
+    except RedisError:
+        return None
+    return version
+
+
+def invalidate_profile(profile_id):
+    try:
+        cache.set(PROFILE_VERSION_KEY.format(profile_id), uuid4().hex, timeout=settings.PROFILE_VERSION_TTL)
+    except RedisError:
+        pass
+
+
+def invalidate_user_profile(user_id):
+    try:
+        profile_id = cache.get(PROFILE_OWNER_KEY.format(user_id))
+    except RedisError:
+        return
+    if profile_id is not None:
+        invalidate_profile(profile_id)
+
+
+def get_or_build_profile(profile_id, version, host, build):
+    """
+    Returns the cached representation of a profile, building it with
+    `build()` on a miss. Only one caller rebuilds an expired entry, reading
+    from the primary; the others wait for it up to PROFILE_CACHE_LOCK_TIMEOUT
+    seconds.
+    """
+    key = PROFILE_KEY.format(profile_id, version, host)
+    lock_key = PROFILE_LOCK_KEY.format(profile_id, version, host)
+    try:
+        data = cache.get(key)
+        if data is not None:
+            return data
+        if not cache.add(lock_key, 1, timeout=settings.PROFILE_CACHE_LOCK_TIMEOUT):
+            return _wait_for(key) or build()
+    except RedisError:
+        return build()
+    try:
+        # the entry outlives this request under a version that may be only
+        # milliseconds old, so it must not come from a lagging replica
+        with replica_reads(False):
+            data = build()
+        try:
+            cache.set_many({
+                key: data,
+                PROFILE_OWNER_KEY.format(data['user']): profile_id,
+            }, timeout=settings.PROFILE_CACHE_TTL)
+        except RedisError:
+            pass
+    finally:
+        try:
+            cache.delete(lock_key)
+        except RedisError:
+            pass
+    return data
+
+
+def _wait_for(key):
+    deadline = time.monotonic() + settings.PROFILE_CACHE_LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        data = cache.get(key)
+        if data is not None:
+            return data
+    return None
@@ -0,0 +1,86 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.utils.crypto import constant_time_compare, get_random_string
+from django.utils.module_loading import import_string
+from redis import RedisError
+
+from .utils import redis_client
+
+
+User = get_user_model()
+
+CODE_KEY = 'code:{}:{}'
+
+# Deletes the code only when it matches: 1 - consumed, 0 - wrong code, -1 - no code.
+CONSUME_SCRIPT = """
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return -1
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+return 0
+"""
+
+
+def get_code_store():
+    return import_string(settings.ACCOUNT_CODE_STORE)()
+
+
+class DatabaseCodeStore:
+    """Keeps the code in User.activation_code; expiry is done by the sweeper task."""
+
+    def issue(self, user, purpose):
+        code = get_random_string(10)
+        User.objects.filter(pk=user.pk).update(
+            activation_code=code, activation_code_created_at=timezone.now())
+        return code
+
+    def check(self, email, purpose, code):
+        return User.objects.filter(email=email, activation_code=code).exists()
+
+    def consume(self, email, purpose, code):
+        return bool(User.objects.filter(email=email, activation_code=code).update(
+            activation_code=None, activation_code_created_at=None))
+
+
+class RedisCodeStore:
+    """
+    Keeps codes as Redis keys expiring after ACCOUNT_CODE_TTLS[purpose].
+    Codes missing from Redis, and all codes while Redis is unavailable,
+    are looked up in the database store.
+    """
+
+    def __init__(self):
+        self.fallback = DatabaseCodeStore()
+        self._consume = redis_client.register_script(CONSUME_SCRIPT)
+
+    def issue(self, user, purpose):
+        code = get_random_string(10)
+        ttl = settings.ACCOUNT_CODE_TTLS[purpose]
+        try:
+            redis_client.set(CODE_KEY.format(purpose, user.email), code, ex=ttl)
+        except RedisError:
+            return self.fallback.issue(user, purpose)
+        return code
+
+    def check(self, email, purpose, code):
+        try:
+            stored = redis_client.get(CODE_KEY.format(purpose, email))
+        except RedisError:
+            stored = None
+        if stored is None:
+            return self.fallback.check(email, purpose, code)
+        return constant_time_compare(stored.decode(), code)
+
+    def consume(self, email, purpose, code):
+        try:
+            result = self._consume(keys=[CODE_KEY.format(purpose, email)], args=[code])
+        except RedisError:
+            result = -1
+        if result == -1:
+            return self.fallback.consume(email, purpose, code)
+        return result == 1
@@ -0,0 +1,108 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import hashers
+from rest_framework.exceptions import APIException
+
+
+class HashingUnavailable(APIException):
+    status_code = 503
+    default_detail = 'Сервер перегружен, попробуйте позже'
+    default_code = 'hashing_unavailable'
+
+
+_pool = None
+_pool_lock = threading.Lock()
+# hashes queued or running; callers wait up to PASSWORD_HASHING_QUEUE_TIMEOUT
+# for a free slot and get a 503 after that instead of piling up requests
+_slots = threading.BoundedSemaphore(settings.PASSWORD_HASHING_MAX_PENDING)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # workers are started from a fresh interpreter, not forked from a
+            # web or celery process with its threads, sockets and heap
+            _pool = ProcessPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS, initializer=django.setup,
+                mp_context=multiprocessing.get_context(settings.PASSWORD_HASHING_START_METHOD))
+        return _pool
+
+
+def _reset_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+
+
+def _verify(password, encoded):
+    """Returns whether the password matches and, if it does, an upgraded hash when one is due."""
+    if not hashers.check_password(password, encoded):
+        return False, None
+    preferred = hashers.get_hasher('default')
+    hasher = hashers.identify_hasher(encoded)
+    if hasher.algorithm != preferred.algorithm or preferred.must_update(encoded):
+        return True, hashers.make_password(password)
+    return True, None
+
+
+def _submit(fn, *args, block=False):
+    if not settings.PASSWORD_HASHING_WORKERS:
+        future = Future()
+        future.set_result(fn(*args))
+        return future
+    if block:
+        _slots.acquire()
+    elif not _slots.acquire(timeout=settings.PASSWORD_HASHING_QUEUE_TIMEOUT):
+        raise HashingUnavailable()
+    try:
+        pool = _get_pool()
+        try:
+            future = pool.submit(fn, *args)
+        except BrokenProcessPool:
+            # a worker died (e.g. killed for memory); start a fresh pool
+            _reset_pool(pool)
+            future = _get_pool().submit(fn, *args)
+    except BaseException:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    return future
+
+
+def make_password(password):
+    """Hashes with the preferred hasher in the hashing process pool."""
+    return _submit(hashers.make_password, password).result()
+
+
+def make_passwords(passwords):
+    """
+    Hashes many passwords in parallel, for batch jobs. Waits for free
+    slots instead of failing, so it never has more than
+    PASSWORD_HASHING_MAX_PENDING hashes in flight.
+    """
+    futures = [_submit(hashers.make_password, password, block=True) for password in passwords]
+    return [future.result() for future in futures]
+
+
+def verify(password, encoded):
+    """Checks a password in the hashing pool, see _verify()."""
+    return _submit(_verify, password, encoded).result()
+
+
+async def amake_password(password):
+    future = await sync_to_async(_submit, thread_sensitive=False)(hashers.make_password, password)
+    return await asyncio.wrap_future(future)
+
+
+async def averify(password, encoded):
+    future = await sync_to_async(_submit, thread_sensitive=False)(_verify, password, encoded)
+    return await asyncio.wrap_future(future)
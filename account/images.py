@@ -0,0 +1,112 @@
+import hashlib
+import io
+import json
+import logging
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import invalidate_profile
+from .models import Profile
+
+
+logger = logging.getLogger(__name__)
+
+SAVE_OPTIONS = {
+    'webp': {'format': 'WEBP', 'method': 4},
+    'jpeg': {'format': 'JPEG', 'optimize': True, 'progressive': True},
+}
+
+
+def variant_prefix(data):
+    """
+    Storage directory for the variants of an upload. It is derived from the
+    upload bytes and the variant settings, so identical uploads share files
+    and changed settings produce new ones.
+    """
+    digest = hashlib.sha256(data)
+    digest.update(json.dumps(
+        [settings.AVATAR_VARIANTS, settings.AVATAR_FORMATS, settings.AVATAR_QUALITY],
+        sort_keys=True).encode())
+    digest = digest.hexdigest()
+    return f'{settings.AVATAR_VARIANTS_DIR}/{digest[:2]}/{digest}'
+
+
+def variant_names(prefix):
+    return {
+        variant: {fmt: f'{prefix}/{variant}.{fmt}' for fmt in settings.AVATAR_FORMATS}
+        for variant in settings.AVATAR_VARIANTS
+    }
+
+
+def decode(data):
+    """
+    Decodes an upload once, already reduced towards the largest variant
+    where the format allows it (JPEG draft mode), and rotated by its EXIF
+    orientation. The returned image carries no metadata.
+    """
+    image = Image.open(io.BytesIO(data))
+    if image.width * image.height > settings.AVATAR_MAX_PIXELS:
+        raise ValueError(f'{image.width}x{image.height} image is too large')
+    largest = max(settings.AVATAR_VARIANTS.values())
+    image.draft('RGB', (largest, largest))
+    image = ImageOps.exif_transpose(image)
+    mode = 'RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB'
+    # convert() copies pixels only, leaving EXIF, ICC and comments behind
+    return image.convert(mode)
+
+
+def render_variants(image):
+    """Yields (variant, format, bytes), square crops for every AVATAR_VARIANTS size."""
+    largest = max(settings.AVATAR_VARIANTS.values())
+    side = min(largest, image.width, image.height)
+    square = ImageOps.fit(image, (side, side), Image.Resampling.LANCZOS)
+    for variant, size in sorted(settings.AVATAR_VARIANTS.items(), key=lambda item: -item[1]):
+        size = min(size, side)
+        resized = square if size == side else square.resize((size, size), Image.Resampling.LANCZOS)
+        for fmt in settings.AVATAR_FORMATS:
+            frame = resized
+            if fmt == 'jpeg' and resized.mode == 'RGBA':
+                flat = Image.new('RGB', resized.size, 'white')
+                flat.paste(resized, mask=resized.getchannel('A'))
+                frame = flat
+            buffer = io.BytesIO()
+            frame.save(buffer, quality=settings.AVATAR_QUALITY, **SAVE_OPTIONS[fmt])
+            yield variant, fmt, buffer.getvalue()
+
+
+def store_variants(data):
+    """Renders and stores the variants of an upload unless they are already stored."""
+    prefix = variant_prefix(data)
+    names = variant_names(prefix)
+    if all(default_storage.exists(name) for formats in names.values() for name in formats.values()):
+        return names
+    for variant, fmt, content in render_variants(decode(data)):
+        # concurrent workers may race on the same upload; keep whichever name storage gave us
+        names[variant][fmt] = default_storage.save(names[variant][fmt], ContentFile(content))
+    return names
+
+
+def process_profile_image(profile_id, name):
+    """
+    Builds the variants of a profile image and records them, unless the
+    profile got a different image meanwhile. Returns the variant names.
+    """
+    try:
+        with default_storage.open(name, 'rb') as file:
+            data = file.read()
+    except FileNotFoundError:
+        return None
+    try:
+        variants = store_variants(data)
+    except (UnidentifiedImageError, Image.DecompressionBombError, ValueError, OSError) as error:
+        logger.warning('Profile %s image %s is not processed: %s', profile_id, name, error)
+        return None
+    updated = Profile.objects.filter(pk=profile_id, image=name).update(
+        image_variants=variants, updated_at=timezone.now())
+    if updated:
+        invalidate_profile(profile_id)
+    return variants
@@ -0,0 +1,234 @@
+import json
+import logging
+import smtplib
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.template.loader import get_template
+from django.utils.html import strip_tags
+from redis import RedisError
+
+from . import utils
+from .utils import claim_batch, redis_client, release_batch
+
+
+logger = logging.getLogger(__name__)
+
+MAIL_QUEUE_KEY = 'mail:queue'
+MAIL_RETRY_KEY = 'mail:retry'
+# sorted set of the lists holding batches being sent, scored by claim time
+MAIL_PROCESSING_KEY = 'mail:processing'
+
+
+class PersistentConnection:
+    """
+    Mail backend connection kept open for the lifetime of the process.
+    An SMTP connection idle for longer than EMAIL_HEALTHCHECK_INTERVAL is
+    probed with NOOP before reuse and reopened if the server dropped it.
+    """
+
+    def __init__(self, **backend_kwargs):
+        self.backend_kwargs = backend_kwargs
+        self._backend = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def send_messages(self, messages):
+        """
+        Sends messages, built by _email(), with one send_messages() call and
+        returns (message, error) for each message that failed. The backend
+        stops at the first error, so the messages after the failed one go
+        out in a further call. When the server dropped the connection the
+        failed message gets one more try over a new connection.
+        """
+        failed = []
+        reconnected = False
+        with self._lock:
+            while messages:
+                for message in messages:
+                    message.attempted = False
+                try:
+                    self._get().send_messages(messages)
+                    break
+                except (smtplib.SMTPException, OSError) as exc:
+                    attempted = sum(message.attempted for message in messages)
+                    # SMTPException is an OSError too; other OSErrors come from the socket
+                    dropped = (isinstance(exc, smtplib.SMTPServerDisconnected)
+                               or not isinstance(exc, smtplib.SMTPException))
+                    if dropped:
+                        self._close()
+                    if not attempted:
+                        # the connection could not be opened
+                        failed.extend((message, exc) for message in messages)
+                        break
+                    # the backend renders every message right before handing it over,
+                    # so the last attempted one failed and those before it were sent
+                    if dropped and not reconnected:
+                        reconnected = True
+                        messages = messages[attempted - 1:]
+                        continue
+                    failed.append((messages[attempted - 1], exc))
+                    messages = messages[attempted:]
+                finally:
+                    self._last_used = time.monotonic()
+        return failed
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def _get(self):
+        if self._backend is not None and not self._is_alive():
+            self._close()
+        if self._backend is None:
+            self._backend = get_connection(fail_silently=False, **self.backend_kwargs)
+            self._backend.open()
+        return self._backend
+
+    def _is_alive(self):
+        if not hasattr(self._backend, 'connection'):
+            return True
+        smtp = self._backend.connection
+        if smtp is None:
+            return False
+        if time.monotonic() - self._last_used < settings.EMAIL_HEALTHCHECK_INTERVAL:
+            return True
+        try:
+            return smtp.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _close(self):
+        if self._backend is not None:
+            try:
+                self._backend.close()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._backend = None
+
+
+connection = PersistentConnection()
+
+
+@lru_cache(maxsize=None)
+def _template(name):
+    return get_template(name)
+
+
+def activation_message(email, activation_code):
+    context = {
+        'text_detail': 'спасибо за регистрацию',
+        'email': email,
+        'domain': 'http://0.0.0.0:8000',
+        'activation_code': activation_code
+    }
+    html = _template('activation.html').render(context)
+    return {
+        'subject': 'Активация аккаунта!',
+        'body': strip_tags(html),
+        'from_email': 'romanoffnikolaus@gmail.com',
+        'to': [email],
+        'html': html,
+    }
+
+
+def password_reset_message(email, activation_code):
+    return {
+        'subject': 'Восстановление пароля',
+        'body': f'Ваш код восстановления: {activation_code}',
+        'from_email': 'example@gmail.com',
+        'to': [email],
+    }
+
+
+class _Email(EmailMultiAlternatives):
+    """Notes when a backend renders it for sending, see PersistentConnection.send_messages()."""
+    attempted = False
+
+    def message(self):
+        self.attempted = True
+        return super().message()
+
+
+def _email(message):
+    email = _Email(message['subject'], message['body'], message['from_email'], message['to'])
+    email.source = message
+    if message.get('html'):
+        email.attach_alternative(message['html'], 'text/html')
+    return email
+
+
+def deliver(messages, conn=None):
+    """
+    Sends messages over the persistent connection in one batch. Failed
+    messages are scheduled for a retry with exponential backoff, up to
+    EMAIL_MAX_RETRIES. Returns the number of messages sent.
+    """
+    conn = conn or connection
+    emails = [_email(message) for message in messages]
+    failed = conn.send_messages(emails)
+    for email, exc in failed:
+        logger.error('Failed to send email to %s: %r', email.to, exc)
+        _schedule_retry(email.source)
+    return len(emails) - len(failed)
+
+
+def _schedule_retry(message):
+    attempts = message.get('attempts', 0) + 1
+    if attempts > settings.EMAIL_MAX_RETRIES:
+        logger.error('Giving up on email to %s after %s attempts', message['to'], attempts - 1)
+        return
+    message = {**message, 'attempts': attempts}
+    retry_at = time.time() + settings.EMAIL_RETRY_BACKOFF * 2 ** (attempts - 1)
+    try:
+        redis_client.zadd(MAIL_RETRY_KEY, {json.dumps(message): retry_at})
+    except RedisError:
+        logger.exception('Lost email to %s: retry queue unavailable', message['to'])
+
+
+def send(message):
+    """
+    Queues a message and drains the queue, so a worker picking up a burst
+    of mail tasks sends them in micro-batches over one connection.
+    Without Redis the message is delivered directly.
+    """
+    try:
+        redis_client.rpush(MAIL_QUEUE_KEY, json.dumps(message))
+    except RedisError:
+        return deliver([message])
+    return flush()
+
+
+def flush(batch_size=None):
+    """
+    Sends queued messages in batches. Each batch is moved to a processing
+    list of its own and removed only after it was sent, so mail claimed by
+    a worker that dies is put back by requeue_stalled().
+    """
+    batch_size = batch_size or settings.EMAIL_BATCH_SIZE
+    sent = 0
+    while True:
+        key, batch = claim_batch(MAIL_QUEUE_KEY, MAIL_PROCESSING_KEY, batch_size)
+        if not batch:
+            return sent
+        sent += deliver([json.loads(message) for message in batch])
+        release_batch(MAIL_PROCESSING_KEY, key)
+
+
+def requeue_stalled():
+    """Queues mail again that was claimed more than EMAIL_PROCESSING_TIMEOUT seconds ago."""
+    return utils.requeue_stalled(MAIL_QUEUE_KEY, MAIL_PROCESSING_KEY, settings.EMAIL_PROCESSING_TIMEOUT)
+
+
+def requeue_due_retries():
+    now = time.time()
+    with redis_client.pipeline() as pipe:
+        pipe.zrangebyscore(MAIL_RETRY_KEY, '-inf', now)
+        pipe.zremrangebyscore(MAIL_RETRY_KEY, '-inf', now)
+        due, _ = pipe.execute()
+    if due:
+        redis_client.rpush(MAIL_QUEUE_KEY, *due)
+    return len(due)
@@ -0,0 +1,44 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import get_hashers
+from django.core.management.base import BaseCommand
+
+from account import hashing
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures the cost of every hasher in PASSWORD_HASHERS in this process, '
+        'then the throughput of the preferred one through the hashing pool with '
+        '--concurrency callers. Tune ARGON2_*/SCRYPT_* and PASSWORD_HASHING_* '
+        'in .env and rerun to compare.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=20)
+        parser.add_argument('--concurrency', type=int, default=16)
+
+    def handle(self, *args, **options):
+        count = options['count']
+        for hasher in get_hashers():
+            salt = hasher.salt()
+            started = time.perf_counter()
+            for i in range(count):
+                hasher.encode(f'password{i}', salt)
+            self.report(f'{hasher.algorithm} inline', count, time.perf_counter() - started)
+
+        passwords = [f'password{i}' for i in range(count * options['concurrency'])]
+        hashing.make_password('warm up')
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as callers:
+            started = time.perf_counter()
+            hashes = list(callers.map(hashing.make_password, passwords))
+            self.report(
+                f'{get_hashers()[0].algorithm} pool of {settings.PASSWORD_HASHING_WORKERS}',
+                len(hashes), time.perf_counter() - started)
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(
+            f'{label}: {count} hashes in {elapsed:.2f}s '
+            f'({elapsed / count * 1000:.1f}ms each, {count / elapsed:.1f} hashes/s)')
@@ -0,0 +1,47 @@
+import time
+
+from django.core.mail import get_connection
+from django.core.management.base import BaseCommand
+
+from account import mail
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures email throughput of a connection per message against the pooled '
+        'connection. Point it at a local SMTP stand-in, e.g. '
+        '`python -m aiosmtpd -n -l localhost:1025`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--port', type=int, default=1025)
+        parser.add_argument('--count', type=int, default=500)
+
+    def handle(self, *args, **options):
+        backend_kwargs = {
+            'backend': 'django.core.mail.backends.smtp.EmailBackend',
+            'host': options['host'],
+            'port': options['port'],
+            'username': '',
+            'password': '',
+            'use_tls': False,
+        }
+        messages = [
+            mail.activation_message(f'user{i}@example.com', f'code{i:06d}')
+            for i in range(options['count'])
+        ]
+
+        started = time.perf_counter()
+        for message in messages:
+            get_connection(**backend_kwargs).send_messages([mail._email(message)])
+        self.report('connection per message', len(messages), time.perf_counter() - started)
+
+        conn = mail.PersistentConnection(**backend_kwargs)
+        started = time.perf_counter()
+        sent = mail.deliver(messages, conn=conn)
+        conn.close()
+        self.report('pooled connection', sent, time.perf_counter() - started)
+
+    def report(self, label, count, elapsed):
+        self.stdout.write(f'{label}: {count} messages in {elapsed:.2f}s ({count / elapsed:.0f} msg/s)')
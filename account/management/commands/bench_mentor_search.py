@@ -0,0 +1,103 @@
+import random
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import RequestFactory
+
+from account.models import Profile
+from account.search import update_search_vectors
+from account.views import MentorSearchView
+
+
+User = get_user_model()
+
+PREFIX = 'bench_'
+WORDS = (
+    'python', 'django', 'postgres', 'design', 'marketing', 'english', 'math', 'physics',
+    'music', 'guitar', 'data', 'analytics', 'frontend', 'react', 'devops', 'kubernetes',
+    'photography', 'chess', 'history', 'biology', 'chemistry', 'writing', 'finance', 'sales',
+)
+NAMES = ('Aibek', 'Asel', 'Ivan', 'Anna', 'Nurlan', 'Aigerim', 'Petr', 'Elena', 'Bakyt', 'Dina')
+
+
+class Command(BaseCommand):
+    help = (
+        'Generates --users users (--mentor-share of them active mentors with profiles), '
+        'then times mentor search requests and reports p50/p95 per query kind. '
+        'Needs PostgreSQL. Generated users are removed afterwards unless --keep.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--mentor-share', type=float, default=0.2)
+        parser.add_argument('--requests', type=int, default=200, help='Requests per query kind')
+        parser.add_argument('--batch-size', type=int, default=10_000)
+        parser.add_argument('--keep', action='store_true')
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Mentor search benchmarks need PostgreSQL')
+        rng = random.Random(42)
+        if not User.objects.filter(username__startswith=PREFIX).exists():
+            self.generate(rng, options)
+        try:
+            self.benchmark(rng, options['requests'])
+        finally:
+            if not options['keep']:
+                deleted = User.objects.filter(username__startswith=PREFIX).delete()[0]
+                self.stdout.write(f'Removed {deleted} generated rows')
+
+    def generate(self, rng, options):
+        started = time.perf_counter()
+        total, batch_size = options['users'], options['batch_size']
+        for offset in range(0, total, batch_size):
+            users = []
+            for i in range(offset, min(offset + batch_size, total)):
+                mentor = rng.random() < options['mentor_share']
+                users.append(User(
+                    username=f'{PREFIX}{rng.choice(WORDS)}{i}', slug=f'{PREFIX}{i}',
+                    email=f'{PREFIX}{i}@example.com', password='!',
+                    first_name=rng.choice(NAMES), last_name=f'{rng.choice(NAMES)}ov',
+                    is_mentor=mentor, is_active=mentor or rng.random() < 0.8,
+                    experience='Онлайн' if mentor else '', audience='',
+                ))
+            with transaction.atomic():
+                users = User.objects.bulk_create(users)
+                mentors = [user for user in users if user.is_mentor]
+                Profile.objects.bulk_create([
+                    Profile(user=user, language=rng.choice(('Ru', 'En', 'Kg')),
+                            competence=' '.join(rng.sample(WORDS, 3)))
+                    for user in mentors
+                ])
+                update_search_vectors(User.objects.filter(id__in=[user.id for user in mentors]))
+            self.stdout.write(f'{offset + len(users)} users generated', ending='\r')
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE account_user')
+            cursor.execute('ANALYZE account_profile')
+        self.stdout.write(f'\n{total} users generated in {time.perf_counter() - started:.0f}s')
+
+    def benchmark(self, rng, requests):
+        view = MentorSearchView.as_view()
+        factory = RequestFactory(SERVER_NAME='localhost')
+        kinds = {
+            'first page': lambda: {},
+            'full text': lambda: {'q': rng.choice(WORDS)},
+            'full text, two words': lambda: {'q': ' '.join(rng.sample(WORDS, 2))},
+            'fuzzy username': lambda: {'username': rng.choice(WORDS)[:-1] + 'x'},
+            'filters': lambda: {'language': rng.choice(('Ru', 'En', 'Kg')), 'experience': 'Онлайн'},
+            'full text and filters': lambda: {'q': rng.choice(WORDS), 'language': 'Kg'},
+        }
+        for kind, params in kinds.items():
+            timings = []
+            for _ in range(requests):
+                request = factory.get('/api/v1/mentors/', params())
+                started = time.perf_counter()
+                response = view(request)
+                response.render()
+                timings.append((time.perf_counter() - started) * 1000)
+            timings.sort()
+            self.stdout.write(
+                f'{kind}: p50 {timings[len(timings) // 2]:.1f}ms, '
+                f'p95 {timings[int(len(timings) * 0.95)]:.1f}ms')
@@ -0,0 +1,88 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from account.models import Profile
+from account.serializers import ProfileReadSerializer, ProfileSerializer
+from core.compression import brotli
+from core.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = (
+        'Measures one profile list response per --page-size: ProfileSerializer '
+        'time against ProfileReadSerializer over values() rows, rendering with '
+        'DRF JSONRenderer against ORJSONRenderer, and gzip (and brotli, when '
+        'installed) size and time. Profiles are built in memory, so no database '
+        'is needed.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--page-size', type=int, action='append', help='Repeatable, 20 and 100 by default')
+        parser.add_argument('--repeat', type=int, default=200)
+
+    def handle(self, *args, **options):
+        request = RequestFactory(SERVER_NAME='localhost').get('/api/v1/profile/')
+        for page_size in options['page_size'] or [20, 100]:
+            profiles = [self.profile(i) for i in range(page_size)]
+
+            def serializer():
+                return ProfileSerializer(profiles, many=True, context={'request': request}).data
+
+            # what .values(*ProfileReadSerializer.values_fields()) returns
+            rows = [
+                {source: getattr(getattr(profile, source), 'name', getattr(profile, source))
+                 for source in ProfileReadSerializer.values_fields()}
+                for profile in profiles
+            ]
+
+            def read_serializer():
+                return ProfileReadSerializer(rows, many=True, context={'request': request}).data
+
+            data = serializer()
+            body = ORJSONRenderer().render(data)
+            self.stdout.write(f'{page_size} profiles, {len(body)} bytes of JSON:')
+            serialize = self.measure(serializer, options['repeat'])
+            lean = self.measure(read_serializer, options['repeat'])
+            stdlib = self.measure(lambda: JSONRenderer().render(data), options['repeat'])
+            fast = self.measure(lambda: ORJSONRenderer().render(data), options['repeat'])
+            self.stdout.write(
+                f'  serialize: ProfileSerializer {serialize:.3f}ms, '
+                f'ProfileReadSerializer {lean:.3f}ms ({serialize / lean:.1f}x)')
+            self.stdout.write(f'  render json: {stdlib:.3f}ms, orjson: {fast:.3f}ms')
+            self.stdout.write(
+                f'  serialize + render: {serialize + stdlib:.3f}ms -> {lean + fast:.3f}ms, '
+                f'{serialize + stdlib - lean - fast:.3f}ms saved per request')
+            compressors = {'gzip': compress_string}
+            if brotli is not None:
+                compressors['br'] = lambda content: brotli.compress(
+                    content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+            for name, compress in compressors.items():
+                elapsed = self.measure(lambda: compress(body), options['repeat'])
+                self.stdout.write(f'  {name}: {len(compress(body))} bytes in {elapsed:.3f}ms')
+
+    def profile(self, i):
+        variants = {
+            variant: {fmt: f'avatars/ab/{i:064x}/{variant}.{fmt}' for fmt in settings.AVATAR_FORMATS}
+            for variant in settings.AVATAR_VARIANTS
+        }
+        return Profile(
+            id=i, user_id=i, competence='Python, Django, PostgreSQL', language='Ru',
+            site_url=f'https://example.com/{i}', twitter_url=f'https://twitter.com/user{i}',
+            image=f'media/{i}.jpg', image_variants=variants, updated_at=timezone.now(),
+        )
+
+    def measure(self, func, repeat):
+        """Median milliseconds per call."""
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        return timings[len(timings) // 2]
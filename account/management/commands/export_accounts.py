@@ -0,0 +1,58 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from account import export
+from account.serializers import AccountExportSerializer
+
+
+class Command(BaseCommand):
+    help = (
+        'Writes users with their profiles as CSV or JSONL, gzipped for *.gz '
+        'outputs or with --gzip. Rows are streamed from the database, so memory '
+        'use does not depend on the number of users.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help='File path, - for stdout')
+        parser.add_argument('--format', choices=export.FORMATS,
+                            help='Defaults to the output extension, csv for stdout')
+        parser.add_argument('--columns', help=f'Comma separated, all by default: {", ".join(export.EXPORT_FIELDS)}')
+        parser.add_argument('--joined-after', help='ISO date or datetime, inclusive')
+        parser.add_argument('--joined-before', help='ISO date or datetime, exclusive')
+        parser.add_argument('--updated-after', help='ISO date or datetime, inclusive')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--chunk-size', type=int)
+
+    def handle(self, *args, **options):
+        path = options['output']
+        name = path[:-3] if path.endswith('.gz') else path
+        output = options['format'] or next(
+            (fmt for fmt in export.FORMATS if name.endswith(f'.{fmt}')), 'csv')
+        serializer = AccountExportSerializer(data={
+            key: value for key, value in {
+                'output': output,
+                'columns': options['columns'],
+                'joined_after': options['joined_after'],
+                'joined_before': options['joined_before'],
+                'updated_after': options['updated_after'],
+                'gzip': options['gzip'] or path.endswith('.gz'),
+            }.items() if value is not None
+        })
+        if not serializer.is_valid():
+            raise CommandError(serializer.errors)
+        params = serializer.validated_data
+
+        chunks = export.export(
+            params['columns'], params['output'], params['gzip'], chunk_size=options['chunk_size'],
+            joined_after=params.get('joined_after'), joined_before=params.get('joined_before'),
+            updated_after=params.get('updated_after'))
+        if path == '-':
+            for chunk in chunks:
+                sys.stdout.buffer.write(chunk)
+            sys.stdout.buffer.flush()
+            return
+        with open(path, 'wb') as file:
+            for chunk in chunks:
+                file.write(chunk)
+        self.stderr.write(f'Exported to {path}')
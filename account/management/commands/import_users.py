@@ -0,0 +1,138 @@
+import csv
+import json
+import os
+import time
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from slugify import slugify
+
+from account import availability, hashing, outbox
+from account.serializers import UserImportSerializer
+from account.tasks import send_activation_code_celery
+
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = (
+        'Creates users from a CSV (with a header row) or JSONL file with the '
+        'registration fields: username, first_name, last_name, email, password '
+        'and optionally is_mentor. The file is read in batches, so memory does '
+        'not grow with its size. Progress is checkpointed after every batch and '
+        'a rerun continues after the last imported batch.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=('csv', 'jsonl'),
+                            help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--checkpoint',
+                            help='Checkpoint file, <path>.checkpoint by default')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or os.path.splitext(path)[1].lstrip('.').lower()
+        if fmt not in ('csv', 'jsonl'):
+            raise CommandError('Unknown file format, pass --format csv or --format jsonl')
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        done = self.read_checkpoint(checkpoint)
+        if done:
+            self.stdout.write(f'Resuming after row {done}')
+
+        rows = islice(self.read_rows(path, fmt), done, None)
+        created = rejected = processed = 0
+        started = time.perf_counter()
+        while True:
+            batch = list(islice(rows, options['batch_size']))
+            if not batch:
+                break
+            batch_created = self.import_batch(batch, first_row=done + 1)
+            created += batch_created
+            rejected += len(batch) - batch_created
+            processed += len(batch)
+            done += len(batch)
+            self.write_checkpoint(checkpoint, done)
+            self.stdout.write(
+                f'{done} rows: {created} created, {rejected} rejected, '
+                f'{processed / (time.perf_counter() - started):.0f} rows/s')
+
+        if os.path.exists(checkpoint):
+            os.remove(checkpoint)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {created} users, rejected {rejected} rows in {elapsed:.1f}s '
+            f'({processed / elapsed if elapsed else 0:.0f} rows/s)'))
+
+    def read_rows(self, path, fmt):
+        with open(path, newline='', encoding='utf-8') as file:
+            if fmt == 'csv':
+                for row in csv.DictReader(file):
+                    yield {field: value for field, value in row.items() if value not in ('', None)}
+            else:
+                for line in file:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def import_batch(self, rows, first_row):
+        """Validates and creates one batch of users; returns how many were created."""
+        valid = []
+        for number, row in enumerate(rows, first_row):
+            serializer = UserImportSerializer(data=row)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                data['email'] = User.objects.normalize_email(data['email'])
+                valid.append((number, data))
+            else:
+                self.reject(number, serializer.errors)
+
+        # one query per unique field for the whole batch
+        emails = [data['email'] for _, data in valid]
+        usernames = [data['username'] for _, data in valid]
+        slugs = [slugify(username) for username in usernames]
+        taken = {
+            'email': set(User.objects.filter(email__in=emails).values_list('email', flat=True)),
+            'username': set(User.objects.filter(username__in=usernames).values_list('username', flat=True)),
+            'slug': set(User.objects.filter(slug__in=slugs).values_list('slug', flat=True)),
+        }
+        users_data = []
+        for (number, data), slug in zip(valid, slugs):
+            values = {'email': data['email'], 'username': data['username'], 'slug': slug}
+            duplicate = [field for field, value in values.items() if value in taken[field]]
+            if duplicate:
+                self.reject(number, {field: 'already exists' for field in duplicate})
+                continue
+            for field, value in values.items():
+                taken[field].add(value)
+            users_data.append(data)
+
+        for data, password_hash in zip(users_data, hashing.make_passwords(
+                [data['password'] for data in users_data])):
+            data['password_hash'] = password_hash
+        with transaction.atomic():
+            users = User.objects.bulk_create_users(users_data, batch_size=len(users_data) or 1)
+            outbox.enqueue_many(
+                send_activation_code_celery, [(user.email, user.activation_code) for user in users])
+        # bulk_create sends no post_save
+        availability.add_users(users)
+        return len(users)
+
+    def reject(self, number, errors):
+        self.stderr.write(f'row {number}: {json.dumps(errors, ensure_ascii=False)}')
+
+    def read_checkpoint(self, checkpoint):
+        try:
+            with open(checkpoint) as file:
+                return json.load(file)['rows']
+        except FileNotFoundError:
+            return 0
+
+    def write_checkpoint(self, checkpoint, rows):
+        # write-then-rename, so a crash never leaves a torn checkpoint
+        with open(f'{checkpoint}.tmp', 'w') as file:
+            json.dump({'rows': rows}, file)
+        os.replace(f'{checkpoint}.tmp', checkpoint)
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from account.tasks import load_token_blacklist
+
+
+class Command(BaseCommand):
+    help = 'Loads unexpired blacklisted refresh tokens from the database into Redis'
+
+    def handle(self, *args, **options):
+        count = load_token_blacklist(full=True)
+        self.stdout.write(f'Loaded {count} blacklisted tokens')
@@ -0,0 +1,118 @@
+import asyncio
+import json
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = (
+        'Sends --requests HTTP/1.1 requests to a running server over --concurrency '
+        'keep-alive connections and reports throughput and latency percentiles. '
+        'Use it to compare the WSGI and ASGI deployments, e.g. '
+        '`python manage.py loadtest http://localhost:8000/api/v1/async/profile/`.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help='JSON request body')
+        parser.add_argument('--header', action='append', default=[], help='"Name: value", repeatable')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        url = urlsplit(options['url'])
+        if url.scheme != 'http':
+            raise CommandError('Only http:// urls are supported')
+        if options['data'] is not None:
+            try:
+                json.loads(options['data'])
+            except ValueError as exc:
+                raise CommandError(f'--data is not valid JSON: {exc}')
+        request = self.build_request(url, options)
+
+        started = time.perf_counter()
+        latencies, statuses = asyncio.run(self.run(
+            url.hostname, url.port or 80, request, options['concurrency'], options['requests']))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        self.stdout.write(f'{len(latencies)} requests in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} req/s)')
+        self.stdout.write(f'p50 {self.percentile(latencies, 50):.1f}ms, p99 {self.percentile(latencies, 99):.1f}ms')
+        self.stdout.write('status codes: ' + ', '.join(
+            f'{status}: {count}' for status, count in sorted(statuses.items())))
+
+    def build_request(self, url, options):
+        body = (options['data'] or '').encode()
+        path = url.path or '/'
+        if url.query:
+            path += '?' + url.query
+        headers = [
+            f'{options["method"].upper()} {path} HTTP/1.1',
+            f'Host: {url.netloc}',
+            f'Content-Length: {len(body)}',
+        ]
+        if body:
+            headers.append('Content-Type: application/json')
+        headers.extend(options['header'])
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+
+    async def run(self, host, port, request, concurrency, total):
+        latencies = []
+        statuses = {}
+        remaining = iter(range(total))
+
+        async def worker():
+            reader, writer = await asyncio.open_connection(host, port)
+            try:
+                for _ in remaining:
+                    started = time.perf_counter()
+                    writer.write(request)
+                    status, keep_alive = await self.read_response(reader)
+                    latencies.append((time.perf_counter() - started) * 1000)
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if not keep_alive:
+                        writer.close()
+                        reader, writer = await asyncio.open_connection(host, port)
+            finally:
+                writer.close()
+
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, total))))
+        return latencies, statuses
+
+    async def read_response(self, reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise CommandError('Server closed the connection')
+        status = int(status_line.split()[1])
+        length = 0
+        chunked = False
+        keep_alive = True
+        while True:
+            line = (await reader.readline()).strip()
+            if not line:
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            name, value = name.lower(), value.strip().lower()
+            if name == 'content-length':
+                length = int(value)
+            elif name == 'transfer-encoding' and value == 'chunked':
+                chunked = True
+            elif name == 'connection' and value == 'close':
+                keep_alive = False
+        if chunked:
+            while True:
+                size = int((await reader.readline()).strip(), 16)
+                await reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            await reader.readexactly(length)
+        return status, keep_alive
+
+    def percentile(self, values, percent):
+        if not values:
+            return 0.0
+        return values[min(len(values) - 1, int(len(values) * percent / 100))]
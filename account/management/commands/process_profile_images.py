@@ -0,0 +1,29 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from account import outbox
+from account.models import Profile
+from account.tasks import process_profile_image
+
+
+class Command(BaseCommand):
+    help = (
+        'Queues variant generation for profile images that have no variants yet, '
+        'e.g. images uploaded before variants existed or after AVATAR_VARIANTS changed '
+        '(with --all)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Also profiles that already have variants')
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(image='')
+        if not options['all']:
+            profiles = profiles.filter(image_variants={})
+        rows = profiles.values_list('id', 'image').iterator(chunk_size=2000)
+        queued = 0
+        while batch := list(islice(rows, 2000)):
+            outbox.enqueue_many(process_profile_image, batch)
+            queued += len(batch)
+        self.stdout.write(f'Queued {queued} profile images')
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from account.availability import get_availability_filter
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the bloom filter of taken usernames, emails and slugs from the users table'
+
+    def handle(self, *args, **options):
+        availability_filter = get_availability_filter()
+        availability_filter.rebuild()
+        self.stdout.write(
+            f'Rebuilt {type(availability_filter).__name__}: {availability_filter.num_bits} bits, '
+            f'{availability_filter.num_hashes} hashes')
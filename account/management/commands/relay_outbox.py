@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from account import outbox
+
+
+class Command(BaseCommand):
+    help = 'Publishes account outbox events to Celery'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0.5,
+                            help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain the outbox once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            close_old_connections()
+            published = outbox.relay()
+            if options['once']:
+                self.stdout.write(f'Published {published} events')
+                return
+            if not published:
+                time.sleep(options['interval'])
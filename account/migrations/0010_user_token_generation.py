@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0009_user_activation_code_created_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="user",
+            name="token_generation",
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
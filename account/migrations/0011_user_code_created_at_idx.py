@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-18 16:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0010_user_token_generation"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("activation_code_created_at__isnull", False)),
+                fields=["activation_code_created_at"],
+                name="user_code_created_at_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:00
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0012_outboxevent"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("profile_id", models.BigIntegerField()),
+                ("user_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name="profile",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddField(
+            model_name="user",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name="profile",
+            index=models.Index(
+                fields=["updated_at", "id"], name="profile_updated_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(fields=["updated_at", "id"], name="user_updated_at_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="profiletombstone",
+            index=models.Index(
+                fields=["deleted_at", "id"], name="tombstone_deleted_at_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:03
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+from account.search import update_search_vectors
+
+
+# GIN indexes have no equivalent on other databases, so they are created
+# here instead of in User.Meta.indexes.
+SEARCH_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS user_mentor_search_idx ON account_user "
+    "USING gin (search_vector) WHERE is_mentor AND is_active",
+    "CREATE INDEX IF NOT EXISTS user_mentor_username_trgm_idx ON account_user "
+    "USING gin (username gin_trgm_ops) WHERE is_mentor AND is_active",
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    User = apps.get_model("account", "User")
+    update_search_vectors(
+        User.objects.using(schema_editor.connection.alias).filter(
+            is_mentor=True, is_active=True
+        )
+    )
+    for sql in SEARCH_INDEXES:
+        schema_editor.execute(sql)
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS user_mentor_search_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS user_mentor_username_trgm_idx")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0013_profile_change_feed"),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name="user",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="user",
+            index=models.Index(
+                condition=models.Q(("is_active", True), ("is_mentor", True)),
+                fields=["id"],
+                name="user_mentor_idx",
+            ),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
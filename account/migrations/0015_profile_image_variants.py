@@ -0,0 +1,18 @@
+# Generated by Django 4.1.7 on 2026-10-18 17:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("account", "0014_mentor_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="profile",
+            name="image_variants",
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -1,31 +1,54 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.contrib.auth.base_user import BaseUserManager
 from django.contrib.auth.models import AbstractUser
 from django.utils.crypto import get_random_string
 from slugify import slugify
 from django.utils import timezone
 
+from . import availability
+from .cache import invalidate_user_snapshot, invalidate_profile, invalidate_user_profile
+from .search import SEARCH_FIELDS, update_search_vectors
+
 
 class UserManager(BaseUserManager):
-    def _create(self, email, password, **extra_fields):
+    def _build(self, email, password, password_hash=None, **extra_fields):
         if not email:
             raise ValueError('email is required')
         email = self.normalize_email(email)
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        if password_hash:
+            # hashed ahead of time, e.g. off the event loop in account.hashing
+            user.password = password_hash
+        else:
+            user.set_password(password)
         user.create_activation_code()
-        user.save()
+        user.slug = slugify(user.username)
+        return user
+
+    def _create(self, email, password, **extra_fields):
+        user = self._build(email, password, **extra_fields)
+        user.save(using=self._db)
         return user
 
     def create_user(self, email, password, **extra_fields):
         return self._create(email, password, **extra_fields)
 
     def create_superuser(self, email, password, **extra_fields):
-        user = self._create(email, password, **extra_fields)
-        user.is_active = True
-        user.is_staff = True
-        user.is_superuser = True
-        user.save()
+        extra_fields.setdefault('is_active', True)
+        extra_fields.setdefault('is_staff', True)
+        extra_fields.setdefault('is_superuser', True)
+        return self._create(email, password, **extra_fields)
+
+    def bulk_create_users(self, users_data, batch_size=1000):
+        """
+        Creates users from an iterable of create_user() keyword dicts
+        with one INSERT per batch. Bypasses save() and its signals.
+        """
+        users = [self._build(**data) for data in users_data]
+        return self.bulk_create(users, batch_size=batch_size)
 
 
 class User(AbstractUser):
@@ -46,10 +69,32 @@ class User(AbstractUser):
 
     activation_code = models.CharField(max_length=10, null=True)
     activation_code_created_at = models.DateTimeField(null=True)
+    token_generation = models.PositiveIntegerField(default=0)
+    # set by save(); queryset updates of tokens, codes and passwords leave it alone
+    updated_at = models.DateTimeField(auto_now=True)
+    # names, username and profile competence, kept up to date by account.search
+    search_vector = SearchVectorField(null=True, editable=False)
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email']
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            models.Index(
+                fields=['activation_code_created_at'],
+                condition=models.Q(activation_code_created_at__isnull=False),
+                name='user_code_created_at_idx',
+            ),
+            models.Index(fields=['updated_at', 'id'], name='user_updated_at_idx'),
+            # mentor directory keyset order; the GIN search indexes are PostgreSQL-only,
+            # see migration 0014
+            models.Index(
+                fields=['id'],
+                condition=models.Q(is_mentor=True, is_active=True),
+                name='user_mentor_idx',
+            ),
+        ]
+
     def __str__(self):
         return self.username
 
@@ -62,7 +107,6 @@ class User(AbstractUser):
         code = get_random_string(10)
         self.activation_code = code
         self.activation_code_created_at = timezone.now()
-        self.save()
 
 
 class Profile(models.Model):
@@ -75,11 +119,80 @@ class Profile(models.Model):
     linkedin_url = models.URLField(max_length=255, blank=True)
     youtube_url  = models.URLField(max_length=255, blank=True)
     image = models.ImageField(upload_to="media/", blank=True)
+    # {variant: {format: storage name}}, filled in by the process_profile_image task
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
     is_hidden = models.BooleanField(default=False)
     is_hidden_courses = models.BooleanField(default=False)
     promotions = models.BooleanField(default=False)
     mentor_ads = models.BooleanField(default=False)
     email_ads = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        # (updated_at, id) is the change feed order
+        indexes = [models.Index(fields=['updated_at', 'id'], name='profile_updated_at_idx')]
+
+    def __str__(self):
+        return self.user.username
+
+
+class ProfileTombstone(models.Model):
+    """Deleted profile, kept for the change feed until PROFILE_TOMBSTONE_TTL passes."""
+    profile_id = models.BigIntegerField()
+    user_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=['deleted_at', 'id'], name='tombstone_deleted_at_idx')]
+
+    def __str__(self):
+        return str(self.profile_id)
+
+
+class OutboxEvent(models.Model):
+    """Celery task call recorded in the caller's transaction and published by account.outbox.relay."""
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list)
+    created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return self.task
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def drop_cached_user(sender, instance, **kwargs):
+    invalidate_user_snapshot(instance.pk)
+    invalidate_user_profile(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def drop_cached_profile(sender, instance, **kwargs):
+    invalidate_profile(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def mark_user_taken(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is None or set(availability.FIELDS) & set(update_fields):
+        availability.add_user(instance)
+
+
+# only active mentors are searchable, so only their vectors are kept fresh
+@receiver(post_save, sender=User)
+def refresh_user_search_vector(sender, instance, update_fields=None, **kwargs):
+    if not (instance.is_mentor and instance.is_active):
+        return
+    if update_fields is None or (SEARCH_FIELDS | {'is_active', 'is_mentor'}) & set(update_fields):
+        update_search_vectors(User.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def refresh_profile_search_vector(sender, instance, **kwargs):
+    update_search_vectors(User.objects.filter(pk=instance.user_id, is_mentor=True, is_active=True))
+
+
+@receiver(post_delete, sender=Profile)
+def record_profile_tombstone(sender, instance, **kwargs):
+    ProfileTombstone.objects.create(profile_id=instance.pk, user_id=instance.user_id)
@@ -0,0 +1,35 @@
+from django.conf import settings
+from django.db import transaction
+
+from core.celery import app
+from .models import OutboxEvent
+
+
+def enqueue(task, *args):
+    return OutboxEvent.objects.create(task=task.name, args=list(args))
+
+
+def enqueue_many(task, args_list):
+    return OutboxEvent.objects.bulk_create(
+        [OutboxEvent(task=task.name, args=list(args)) for args in args_list])
+
+
+def relay(batch_size=None):
+    """
+    Publishes pending events to the broker in batches over one producer
+    connection and deletes them. Concurrent relays skip each other's rows.
+    Returns the number of published events.
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    published = 0
+    while True:
+        with transaction.atomic():
+            events = list(
+                OutboxEvent.objects.select_for_update(skip_locked=True).order_by('id')[:batch_size])
+            if not events:
+                return published
+            with app.producer_or_acquire() as producer:
+                for event in events:
+                    app.send_task(event.task, args=event.args, producer=producer)
+            OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        published += len(events)
@@ -0,0 +1,65 @@
+import base64
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ParseError
+from rest_framework.pagination import BasePagination, CursorPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProfileCursorPagination(CursorPagination):
+    ordering = 'id'
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+
+class RankKeysetPagination(BasePagination):
+    """
+    Keyset pagination over a queryset annotated with `rank`, best first and
+    then by id. The cursor is the (rank, id) of the last row, so every page
+    is an index range scan however deep the client pages.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            rank, pk = self.decode_cursor(cursor)
+            queryset = queryset.filter(Q(rank__lt=rank) | Q(rank=rank, id__gt=pk))
+        page = list(queryset.order_by('-rank', 'id')[:page_size + 1])
+        self.next_cursor = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_cursor = self.encode_cursor(page[-1].rank, page[-1].id)
+        return page
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(page_size, self.max_page_size) if page_size > 0 else self.page_size
+
+    def get_paginated_response(self, data):
+        next_url = None
+        if self.next_cursor:
+            next_url = replace_query_param(
+                self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+        return Response({'next': next_url, 'results': data})
+
+    def encode_cursor(self, rank, pk):
+        return base64.urlsafe_b64encode(json.dumps([rank, pk]).encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            rank, pk = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            return float(rank), int(pk)
+        except (ValueError, TypeError):
+            raise ParseError('Некорректный курсор')
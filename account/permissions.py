@@ -1,7 +1,10 @@
-from rest_framework.permissions import BasePermission
+from rest_framework.permissions import BasePermission, SAFE_METHODS
 
 
 class IsOwnerOrReadOnly(BasePermission):
 
     def has_object_permission(self, request, view, obj):
-        return request.user.is_authenticated and request.user==obj.user
+        if request.method in SAFE_METHODS:
+            # hidden profiles of other users are already filtered out by ProfileView.get_queryset
+            return True
+        return request.user.is_authenticated and request.user.pk == obj.user_id
@@ -0,0 +1,59 @@
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.db import connections
+from django.db.models import FloatField, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Cast, Coalesce
+
+
+# User fields the search vector is built from, besides the profile competence
+SEARCH_FIELDS = {'first_name', 'last_name', 'username'}
+
+
+def search_vector(profile_model):
+    """Names and username weighted A, profile competence weighted B."""
+    competence = Subquery(
+        profile_model.objects.filter(user_id=OuterRef('pk')).values('competence')[:1])
+    return (
+        SearchVector('first_name', 'last_name', 'username', weight='A', config=settings.SEARCH_CONFIG)
+        + SearchVector(Coalesce(competence, Value('')), weight='B', config=settings.SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(users):
+    """
+    Recomputes User.search_vector for a user queryset. It is a denormalized
+    copy, because one GIN index cannot cover columns of two tables.
+    """
+    if connections[users.db].vendor != 'postgresql':
+        return 0
+    profile_model = users.model._meta.get_field('profile').related_model
+    return users.update(search_vector=search_vector(profile_model))
+
+
+def search_mentors(queryset, q=None, username=None):
+    """
+    Narrows a mentor queryset and annotates `rank`, higher is better:
+    full-text search over names and competence for q, trigram similarity
+    to username for username. Without PostgreSQL both fall back to
+    substring matching with rank 0.
+    """
+    if connections[queryset.db].vendor != 'postgresql':
+        if q:
+            queryset = queryset.filter(
+                Q(first_name__icontains=q) | Q(last_name__icontains=q)
+                | Q(username__icontains=q) | Q(profile__competence__icontains=q))
+        if username:
+            queryset = queryset.filter(username__icontains=username)
+        return queryset.annotate(rank=Value(0.0))
+    rank = Value(0.0)
+    if q:
+        query = SearchQuery(q, search_type='websearch', config=settings.SEARCH_CONFIG)
+        queryset = queryset.filter(search_vector=query)
+        rank = SearchRank('search_vector', query)
+    if username:
+        queryset = queryset.filter(username__trigram_similar=username)
+        rank = rank + TrigramSimilarity('username', username)
+    # ts_rank and similarity are real (float4); as double precision the rank
+    # survives the round trip through the pagination cursor, so the last
+    # row's ties compare equal to it on the next page
+    return queryset.annotate(rank=Cast(rank, FloatField()))
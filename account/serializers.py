@@ -1,11 +1,22 @@
+from functools import lru_cache
+
 from rest_framework import serializers
+from rest_framework_simplejwt import serializers as jwt_serializers
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import get_user_model
-from django.core.mail import send_mail
+from django.core.files.storage import FileSystemStorage, default_storage
+from django.db import transaction
+from django.db.models import F
+from django.utils.encoding import filepath_to_uri
 
-from .tasks import send_activation_code_celery
+from core.db.router import replica_reads
+from .tasks import send_activation_code_celery, send_password_reset_code_celery, process_profile_image
+from . import export, hashing, outbox
+from .cache import invalidate_user_snapshot
+from .codes import get_code_store
 from .models import Profile
-from .tasks import delete_activation_code
-from django.utils import timezone
+from .tokens import RefreshToken, is_token_revoked, get_token_user_id
 
 
 User = get_user_model()
@@ -38,11 +49,33 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return attrs
     
     def create(self, validated_data):
-        user = User.objects.create_user(**validated_data)
-        send_activation_code_celery.delay(user.email, user.activation_code)
+        if 'password_hash' not in validated_data:
+            validated_data['password_hash'] = hashing.make_password(validated_data['password'])
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            outbox.enqueue(send_activation_code_celery, user.email, user.activation_code)
         return user
 
 
+class UserImportSerializer(RegistrationSerializer):
+    """
+    Registration rules for one imported row. Rows carry no password
+    confirmation, and uniqueness is checked per batch by import_users
+    instead of with a query per row.
+    """
+    password_confirm = None
+
+    class Meta(RegistrationSerializer.Meta):
+        fields = ('username', 'first_name', 'last_name', 'email', 'password', 'is_mentor')
+        extra_kwargs = {
+            'email': {'validators': []},
+            'username': {'validators': []},
+        }
+
+    def validate(self, attrs):
+        return attrs
+
+
 class MentorRegistrationSerializer(serializers.ModelSerializer):
     password_confirm = serializers.CharField(
         min_length=4, required=True, write_only=True)
@@ -95,8 +128,11 @@ class MentorRegistrationSerializer(serializers.ModelSerializer):
             'is_mentor': True
         }
         user_data.update(validated_data)
-        user = User.objects.create_user(**user_data)
-        send_activation_code_celery.delay(user.email, user.activation_code)
+        if 'password_hash' not in user_data:
+            user_data['password_hash'] = hashing.make_password(user_data['password'])
+        with transaction.atomic():
+            user = User.objects.create_user(**user_data)
+            outbox.enqueue(send_activation_code_celery, user.email, user.activation_code)
         return user
 
 
@@ -119,38 +155,32 @@ class ChangePasswordSerializer(serializers.ModelSerializer):
 
     def validate_old_password(self, old_password):
         user = self.context['request'].user
-        if not user.check_password(old_password):
+        valid, _ = hashing.verify(old_password, user.password)
+        if not valid:
             raise serializers.ValidationError('Введен некорректный пароль')
         return old_password
 
     def set_new_password(self):
         user = self.context['request'].user
         new_password = self.validated_data.get('new_password')
-        user.set_password(new_password)
-        user.save()
+        User.objects.filter(pk=user.pk).update(
+            password=hashing.make_password(new_password), token_generation=F('token_generation') + 1)
+        invalidate_user_snapshot(user.pk)
 
 
 class ForgotPasswordSerializer(serializers.Serializer):
     email = serializers.EmailField(required=True)
 
     def validate_email(self, email):
-        if not User.objects.filter(email=email).exists():
+        with replica_reads():
+            self.user = User.objects.filter(email=email).only('id', 'email').first()
+        if self.user is None:
             raise serializers.ValidationError("Пользователь с такими данными не найден")
         return email
 
     def send_verification_email(self):
-        email = self.validated_data.get('email')
-        user = User.objects.get(email=email)
-        user.create_activation_code()
-        user.activation_code_created_at = timezone.now()
-        user.save()
-        delete_activation_code.apply_async(args=[user.id], countdown=120)
-        send_mail(
-            'Восстановление пароля',
-            f'Ваш код восстановления: {user.activation_code}',
-            'example@gmail.com',
-            [user.email]
-        )
+        code = get_code_store().issue(self.user, 'reset')
+        send_password_reset_code_celery.delay(self.user.email, code)
 
 
 class ForgotPasswordCompleteSerializer(serializers.Serializer):
@@ -164,7 +194,7 @@ class ForgotPasswordCompleteSerializer(serializers.Serializer):
         code = attrs.get('code')
         password1 = attrs.get('password')
         password2 = attrs.get('password_confirm')
-        if not User.objects.filter(email=email, activation_code=code).exists():
+        if not get_code_store().check(email, 'reset', code):
             raise serializers.ValidationError('Пользователь не найден или введен неправильный код')
         if password1 != password2:
             raise serializers.ValidationError('Пароли не совпадают')
@@ -173,14 +203,66 @@ class ForgotPasswordCompleteSerializer(serializers.Serializer):
     def set_new_password(self):
         email = self.validated_data.get('email')
         password = self.validated_data.get('password')
+        if not get_code_store().consume(email, 'reset', self.validated_data.get('code')):
+            raise serializers.ValidationError('Пользователь не найден или введен неправильный код')
         user = User.objects.get(email=email)
-        user.set_password(password)
-        user.activation_code = ''
-        user.save()
+        user.password = hashing.make_password(password)
+        user.token_generation += 1
+        user.save(update_fields=['password', 'token_generation'])
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    token_class = RefreshToken
+
+
+class TokenRefreshSerializer(jwt_serializers.TokenRefreshSerializer):
+    token_class = RefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        generation = User.objects.filter(
+            **{api_settings.USER_ID_FIELD: get_token_user_id(refresh)}
+        ).values_list('token_generation', flat=True).first()
+        if generation is None or is_token_revoked(refresh, generation):
+            raise InvalidToken('Токен отозван')
+        return super().validate(attrs)
+
+
+class MediaURLs:
+    """
+    Renders stored file names the way FileField does, for one request. For
+    FileSystemStorage the absolute URL prefix is built once instead of
+    joining and absolutizing every URL.
+    """
+
+    def __init__(self, request):
+        self.request = request
+        self.prefixes = {}
+
+    def __call__(self, name, storage=default_storage):
+        if not name:
+            return None
+        try:
+            prefix = self.prefixes[id(storage)]
+        except KeyError:
+            prefix = self.prefixes[id(storage)] = (
+                self.absolute(storage.url('')) if isinstance(storage, FileSystemStorage) else None)
+        if prefix is None:
+            return self.absolute(storage.url(name))
+        return prefix + filepath_to_uri(name).lstrip('/')
+
+    def absolute(self, url):
+        return self.request.build_absolute_uri(url) if self.request else url
+
+    def variants(self, variants):
+        return {
+            variant: {fmt: self(name) for fmt, name in formats.items()}
+            for variant, formats in variants.items()
+        }
 
 
 class ProfileSerializer(serializers.ModelSerializer):
-    user = serializers.ReadOnlyField(source='user.id')
+    user = serializers.ReadOnlyField(source='user_id')
     language = serializers.ChoiceField(
             required=True,
             help_text='Выберете Ваш основной язык',
@@ -191,6 +273,10 @@ class ProfileSerializer(serializers.ModelSerializer):
             )
         )
     
+    image_variants = serializers.SerializerMethodField(
+        help_text='Ссылки на уменьшенные копии image: {вариант: {формат: url}}. '
+                  'Пусто, пока изображение обрабатывается')
+
     class Meta:
         model = Profile
         fields = '__all__'
@@ -198,9 +284,26 @@ class ProfileSerializer(serializers.ModelSerializer):
     def create(self,validated_data):
         request = self.context.get('request')
         user = request.user
-        profile = Profile.objects.create(user=user, **validated_data)
+        with transaction.atomic():
+            profile = Profile.objects.create(user=user, **validated_data)
+            if profile.image:
+                outbox.enqueue(process_profile_image, profile.pk, profile.image.name)
+        return profile
+
+    def update(self, instance, validated_data):
+        if 'image' not in validated_data:
+            return super().update(instance, validated_data)
+        # the old variants belong to the old image
+        instance.image_variants = {}
+        with transaction.atomic():
+            profile = super().update(instance, validated_data)
+            if profile.image:
+                outbox.enqueue(process_profile_image, profile.pk, profile.image.name)
         return profile
 
+    def get_image_variants(self, profile):
+        return MediaURLs(self.context.get('request')).variants(profile.image_variants)
+
     def validate_site_url(self, website_url):
         if not website_url.startswith('https://'):
             raise serializers.ValidationError(
@@ -226,4 +329,145 @@ class ProfileSerializer(serializers.ModelSerializer):
         if not linkedin_url.startswith('https://www.linkedin.com/'):
             raise serializers.ValidationError('Введенна некорректная ссылка на Linked_in. Пример: "https://www.linkedin.com/in/Krutoy"')
         return linkedin_url
-    
\ No newline at end of file
+    
+
+class ProfileReadSerializer(serializers.BaseSerializer):
+    """
+    Read path of ProfileSerializer for list and retrieve. It renders rows of
+    Profile.objects.values(*ProfileReadSerializer.values_fields()) into the
+    same output, walking a field list compiled once from ProfileSerializer
+    instead of binding and cloning serializer fields for every request.
+    """
+    # SerializerMethodFields, by the model field their method reads
+    method_fields = {'image_variants': ('image_variants', MediaURLs.variants)}
+
+    @classmethod
+    @lru_cache(maxsize=None)
+    def compiled_fields(cls):
+        """(output name, values() key, converter taking (MediaURLs, value) or None)."""
+        compiled = []
+        for name, field in ProfileSerializer().fields.items():
+            if field.write_only:
+                continue
+            if name in cls.method_fields:
+                compiled.append((name, *cls.method_fields[name]))
+            elif isinstance(field, serializers.FileField):
+                storage = Profile._meta.get_field(field.source).storage
+                compiled.append((name, field.source, lambda urls, value, storage=storage: urls(value, storage)))
+            elif isinstance(field, (serializers.DateTimeField, serializers.DateField)):
+                compiled.append((name, field.source, lambda urls, value, field=field:
+                                 None if value is None else field.to_representation(value)))
+            else:
+                compiled.append((name, field.source, None))
+        return tuple(compiled)
+
+    @classmethod
+    @lru_cache(maxsize=256)
+    def compiled_fieldset(cls, fields=None):
+        """compiled_fields() narrowed to the output names in `fields`, all for None."""
+        if fields is None:
+            return cls.compiled_fields()
+        return tuple(field for field in cls.compiled_fields() if field[0] in fields)
+
+    @classmethod
+    def field_names(cls):
+        return tuple(name for name, _, _ in cls.compiled_fields())
+
+    @classmethod
+    def values_fields(cls, fields=None):
+        """Columns to select for `fields`; id is always selected, pagination orders by it."""
+        return tuple(dict.fromkeys(('id', *(source for _, source, _ in cls.compiled_fieldset(fields)))))
+
+    def __init__(self, *args, fields=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fieldset = fields
+
+    def to_representation(self, row):
+        # one per serializer, so a page of rows shares the URL prefixes
+        try:
+            urls = self._media_urls
+        except AttributeError:
+            urls = self._media_urls = MediaURLs(self.context.get('request'))
+        return {
+            name: row[source] if convert is None else convert(urls, row[source])
+            for name, source, convert in self.compiled_fieldset(self.fieldset)
+        }
+
+
+class ProfileFieldsetSerializer(serializers.Serializer):
+    """?fields= and ?exclude= of profile reads; validates into the tuple of output names."""
+    fields = serializers.CharField(required=False, help_text='Только эти поля, через запятую, например id,user,image,language')
+    exclude = serializers.CharField(required=False, help_text='Все поля, кроме этих, через запятую')
+
+    def split(self, value):
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names - set(ProfileReadSerializer.field_names())
+        if unknown:
+            raise serializers.ValidationError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+        return names
+
+    def validate_fields(self, value):
+        return self.split(value)
+
+    def validate_exclude(self, value):
+        return self.split(value)
+
+    def validate(self, attrs):
+        if 'fields' not in attrs and 'exclude' not in attrs:
+            return {'fields': None}
+        selected = attrs.get('fields', ProfileReadSerializer.field_names())
+        excluded = attrs.get('exclude', set())
+        fields = tuple(name for name in ProfileReadSerializer.field_names()
+                       if name in selected and name not in excluded)
+        if not fields:
+            raise serializers.ValidationError('Не выбрано ни одного поля')
+        return {'fields': fields}
+
+
+class AccountExportSerializer(serializers.Serializer):
+    output = serializers.ChoiceField(choices=export.FORMATS, default='csv')
+    columns = serializers.CharField(
+        required=False, help_text=f'Через запятую, по умолчанию все: {", ".join(export.EXPORT_FIELDS)}')
+    joined_after = serializers.DateTimeField(required=False)
+    joined_before = serializers.DateTimeField(required=False)
+    updated_after = serializers.DateTimeField(required=False)
+    gzip = serializers.BooleanField(default=False)
+
+    def validate_columns(self, columns):
+        columns = [column.strip() for column in columns.split(',') if column.strip()]
+        unknown = set(columns) - set(export.EXPORT_FIELDS)
+        if unknown:
+            raise serializers.ValidationError(f'Неизвестные поля: {", ".join(sorted(unknown))}')
+        return columns
+
+    def validate(self, attrs):
+        if not attrs.get('columns'):
+            attrs['columns'] = list(export.EXPORT_FIELDS)
+        return attrs
+
+
+class MentorSearchSerializer(serializers.Serializer):
+    q = serializers.CharField(required=False, max_length=200, help_text='Имя, логин или компетенция')
+    username = serializers.CharField(required=False, max_length=50, help_text='Нечеткий поиск по логину')
+    language = serializers.CharField(required=False, max_length=2)
+    experience = serializers.CharField(required=False, max_length=50)
+    audience = serializers.CharField(required=False, max_length=50)
+
+
+class MentorSerializer(serializers.ModelSerializer):
+    competence = serializers.CharField(source='profile.competence', read_only=True)
+    language = serializers.CharField(source='profile.language', read_only=True)
+
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'first_name', 'last_name', 'experience', 'audience', 'competence', 'language')
+
+
+class AvailabilitySerializer(serializers.Serializer):
+    username = serializers.CharField(required=False, max_length=50)
+    email = serializers.EmailField(required=False)
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError('Укажите username или email')
+        return attrs
@@ -1,19 +1,138 @@
-from .utils import send_activation_code
+import json
+from datetime import datetime, timezone as dt_timezone
+
+from .utils import claim_batch, redis_client, release_batch, requeue_stalled
 from core.celery import app
 from celery import shared_task
+from django.conf import settings
+from django.db import transaction
 from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
 
-from .models import User
+from . import availability, images, mail
+from .models import User, ProfileTombstone
+from .tokens import BLACKLIST_KEY, BLACKLIST_LOADED_KEY, BLACKLIST_PENDING_KEY, BLACKLIST_PROCESSING_KEY
 
 
 @app.task
 def send_activation_code_celery(email, activation_code):
-    send_activation_code(email, activation_code)
+    mail.send(mail.activation_message(email, activation_code))
+
+@app.task
+def send_password_reset_code_celery(email, activation_code):
+    mail.send(mail.password_reset_message(email, activation_code))
+
+@shared_task
+def retry_failed_mail():
+    mail.requeue_stalled()
+    mail.requeue_due_retries()
+    mail.flush()
+
+@shared_task
+def expire_password_reset_codes():
+    """Clears reset codes older than PASSWORD_RESET_CODE_TTL in one UPDATE."""
+    cutoff = timezone.now() - settings.PASSWORD_RESET_CODE_TTL
+    return User.objects.filter(
+        is_active=True, activation_code_created_at__lt=cutoff
+    ).update(activation_code=None, activation_code_created_at=None)
 
 @shared_task
 def delete_activation_code(user_id):
-    user = User.objects.get(id=user_id)
-    if user.activation_code_created_at and timezone.now() - user.activation_code_created_at > timezone.timedelta(minutes=2):
-        user.activation_code = None
-        user.activation_code_created_at = None
-        user.save()
\ No newline at end of file
+    """
+    Deprecated, kept for one release so delete_activation_code messages
+    queued before expire_password_reset_codes still run; clears the code
+    of that one user once it is older than PASSWORD_RESET_CODE_TTL.
+    """
+    cutoff = timezone.now() - settings.PASSWORD_RESET_CODE_TTL
+    return User.objects.filter(
+        id=user_id, is_active=True, activation_code_created_at__lt=cutoff
+    ).update(activation_code=None, activation_code_created_at=None)
+
+@shared_task
+def flush_blacklisted_tokens(batch_size=settings.TOKEN_BLACKLIST_BATCH_SIZE):
+    """
+    Copies JTIs blacklisted in Redis into the token_blacklist tables for audit.
+    Each batch is moved to a processing list first and dropped only after
+    its rows are committed; batches of a run that failed are queued again
+    after TOKEN_BLACKLIST_PROCESSING_TIMEOUT.
+    """
+    requeue_stalled(BLACKLIST_PENDING_KEY, BLACKLIST_PROCESSING_KEY, settings.TOKEN_BLACKLIST_PROCESSING_TIMEOUT)
+    while True:
+        key, records = claim_batch(BLACKLIST_PENDING_KEY, BLACKLIST_PROCESSING_KEY, batch_size)
+        if not records:
+            return
+        records = [json.loads(record) for record in records]
+        user_ids = set(User.objects.filter(
+            id__in={record['user_id'] for record in records}).values_list('id', flat=True))
+        with transaction.atomic():
+            OutstandingToken.objects.bulk_create([
+                OutstandingToken(
+                    jti=record['jti'],
+                    token=record['token'],
+                    user_id=record['user_id'] if record['user_id'] in user_ids else None,
+                    expires_at=datetime.fromtimestamp(record['exp'], tz=dt_timezone.utc),
+                ) for record in records
+            ], ignore_conflicts=True)
+            token_ids = OutstandingToken.objects.filter(
+                jti__in=[record['jti'] for record in records]).values_list('id', flat=True)
+            BlacklistedToken.objects.bulk_create(
+                [BlacklistedToken(token_id=token_id) for token_id in token_ids],
+                ignore_conflicts=True)
+        release_batch(BLACKLIST_PROCESSING_KEY, key)
+        if len(records) < batch_size:
+            return
+
+@shared_task
+def load_token_blacklist(full=False):
+    """
+    Copies unexpired blacklisted tokens from the database into Redis: all of
+    them when Redis has no record of a load (first start, or it lost its
+    data), else those blacklisted since the last load minus
+    TOKEN_BLACKLIST_RELOAD_OVERLAP, which picks up tokens revoked while
+    Redis was unreachable. Returns the number of tokens loaded.
+    """
+    now = timezone.now()
+    loaded_at = None if full else redis_client.get(BLACKLIST_LOADED_KEY)
+    tokens = BlacklistedToken.objects.filter(token__expires_at__gt=now)
+    if loaded_at is not None:
+        since = datetime.fromtimestamp(float(loaded_at), tz=dt_timezone.utc)
+        tokens = tokens.filter(blacklisted_at__gte=since - settings.TOKEN_BLACKLIST_RELOAD_OVERLAP)
+    count = 0
+    with redis_client.pipeline(transaction=False) as pipe:
+        for jti, expires_at in tokens.values_list('token__jti', 'token__expires_at').iterator(chunk_size=2000):
+            pipe.set(BLACKLIST_KEY.format(jti), 1, ex=int((expires_at - now).total_seconds()) + 1)
+            count += 1
+            if count % 2000 == 0:
+                pipe.execute()
+        pipe.set(BLACKLIST_LOADED_KEY, now.timestamp())
+        pipe.execute()
+    return count
+
+@shared_task
+def prune_expired_tokens(batch_size=settings.TOKEN_BLACKLIST_BATCH_SIZE):
+    """Deletes expired outstanding tokens (and their blacklist rows) in batches."""
+    expired = OutstandingToken.objects.filter(expires_at__lt=timezone.now())
+    while True:
+        ids = list(expired.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return
+        OutstandingToken.objects.filter(id__in=ids).delete()
+
+
+@shared_task
+def prune_profile_tombstones():
+    """Deletes profile tombstones older than PROFILE_TOMBSTONE_TTL."""
+    return ProfileTombstone.objects.filter(
+        deleted_at__lt=timezone.now() - settings.PROFILE_TOMBSTONE_TTL).delete()[0]
+
+
+@shared_task
+def rebuild_availability_filter():
+    """Rebuilds the taken-names filter from the users table, dropping deleted users' names."""
+    availability.get_availability_filter().rebuild()
+
+
+@shared_task
+def process_profile_image(profile_id, name):
+    """Builds the resized, metadata-free variants of an uploaded profile image."""
+    images.process_profile_image(profile_id, name)
@@ -1,11 +1,96 @@
+import base64
+import contextvars
+import csv
+import gzip
+import io
+import json
+import os
+import tempfile
+import smtplib
+import socket
+import sqlite3
+import threading
+from decimal import Decimal
+from unittest import skipUnless
+from unittest.mock import patch
+
+from asgiref.sync import SyncToAsync, async_to_sync, iscoroutinefunction
+from django.contrib.auth.hashers import make_password
+from django.core import mail as django_mail
+from django.core.mail.backends import locmem
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.conf import settings
+from django.db import DatabaseError, connection, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import AsyncClient, AsyncRequestFactory, Client, SimpleTestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from redis import RedisError
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase, APIRequestFactory, force_authenticate
 from rest_framework.authtoken.models import Token
-from rest_framework_simplejwt.views import TokenObtainPairView
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
+
+from core.compression import CompressionMiddleware, brotli
+from core.db.backends.postgresql_pool import base as pool_backend
+from core.db.pool import ConnectionPool, PoolTimeout
+from core.parsers import ORJSONParser
+from core.renderers import ORJSONRenderer
+from core.db.router import PrimaryReplicaRouter, ReplicaRoutingMiddleware, replica_reads, PIN_COOKIE, REPLICA_ALIAS
+from .models import User, Profile, OutboxEvent, ProfileTombstone
+from .authentication import CachedJWTAuthentication
+from .cache import PROFILE_VERSION_KEY, get_or_build_profile, user_snapshots
+from .codes import RedisCodeStore
+from .tokens import BLACKLIST_KEY, BLACKLIST_LOADED_KEY, BLACKLIST_PROCESSING_KEY, RefreshToken
+from .utils import redis_client
+from . import serializers, views, async_views, tasks, mail, outbox, hashing, changes, availability
+
+
+def pg_extension_installed(name):
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_extension WHERE extname = %s', [name])
+        return cursor.fetchone() is not None
+
+
+def redis_available():
+    try:
+        return redis_client.ping()
+    except RedisError:
+        return False
 
-from .models import User, Profile
-from . import views
 
+class FlakySMTPBackend(locmem.EmailBackend):
+    """
+    locmem backend failing the way the SMTP backend does: it stops at a
+    refused recipient, and the server drops the connection once when it
+    gets mail for drop@.
+    """
+    batches = []
+    dropped = False
 
+    def send_messages(self, messages):
+        self.batches.append(len(messages))
+        for message in messages:
+            message.message()
+            if message.to[0].startswith('refused@'):
+                raise smtplib.SMTPRecipientsRefused({message.to[0]: (550, b'No such user')})
+            if message.to[0].startswith('drop@') and not FlakySMTPBackend.dropped:
+                FlakySMTPBackend.dropped = True
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+            django_mail.outbox.append(message)
+        return len(messages)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
 class UserTest(APITestCase):
     
     def setUp(self):
@@ -223,4 +308,1021 @@ class UserTest(APITestCase):
         view = views.ProfileView.as_view({'patch':'partial_update'})
         response = view(request, pk=profile)
         assert response.status_code == 200
-        assert response.data['language'] == data['language'] == 'Ru'
\ No newline at end of file
+        assert response.data['language'] == data['language'] == 'Ru'
+
+    def test_logout_all_revokes_tokens(self):
+        data = {'username': 'username', 'password': 'pimp'}
+        request = self.factory.post('login/', data, format='json')
+        response = TokenObtainPairView.as_view()(request)
+        access = response.data['access']
+        request = self.factory.post('refresh/', {'refresh': response.data['refresh']}, format='json')
+        response = TokenRefreshView.as_view()(request)
+        assert response.status_code == 200
+        refresh = response.data['refresh']
+
+        request = self.factory.post('logout/', {'all': True}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = views.APILogoutView.as_view()(request)
+        assert response.status_code == 200
+
+        request = self.factory.post('refresh/', {'refresh': refresh}, format='json')
+        response = TokenRefreshView.as_view()(request)
+        assert response.status_code == 401
+
+        request = self.factory.post('logout/', {'all': True}, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = views.APILogoutView.as_view()(request)
+        assert response.status_code == 401
+
+    def test_logout_blacklists_refresh_token(self):
+        refresh = str(RefreshToken.for_user(self.user))
+        request = self.factory.post('logout/', {'refresh_token': refresh}, format='json')
+        force_authenticate(request, user=self.user)
+        response = views.APILogoutView.as_view()(request)
+        assert response.data == 'Всего доброго!'
+
+        request = self.factory.post('refresh/', {'refresh': refresh}, format='json')
+        response = TokenRefreshView.as_view()(request)
+        assert response.status_code == 401
+
+    def test_blacklist_is_read_from_database_while_redis_is_down(self):
+        token = RefreshToken.for_user(self.user)
+        with patch.object(redis_client, 'pipeline', side_effect=RedisError):
+            token.blacklist()
+        assert BlacklistedToken.objects.filter(token__jti=token['jti']).exists()
+        with patch.object(redis_client, 'exists', side_effect=RedisError):
+            with self.assertRaises(TokenError):
+                RefreshToken(str(token))
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_refresh_checks_blacklist_in_redis_only(self):
+        token = RefreshToken.for_user(self.user)
+        with self.assertNumQueries(0):
+            RefreshToken(str(token))
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_token_blacklisted_during_redis_outage_stays_revoked(self):
+        redis_client.delete(BLACKLIST_LOADED_KEY)
+        tasks.load_token_blacklist()
+        token = RefreshToken.for_user(self.user)
+        with patch.object(redis_client, 'pipeline', side_effect=RedisError):
+            token.blacklist()
+        # Redis is back, without the JTI, until the next load
+        RefreshToken(str(token))
+        assert tasks.load_token_blacklist() == 1
+        with self.assertRaises(TokenError):
+            RefreshToken(str(token))
+
+        # Redis lost its data: the next load copies the whole blacklist again
+        redis_client.delete(BLACKLIST_KEY.format(token['jti']), BLACKLIST_LOADED_KEY)
+        BlacklistedToken.objects.update(blacklisted_at=timezone.now() - timezone.timedelta(days=1))
+        assert tasks.load_token_blacklist() == 1
+        with self.assertRaises(TokenError):
+            RefreshToken(str(token))
+        redis_client.delete(BLACKLIST_KEY.format(token['jti']), BLACKLIST_LOADED_KEY)
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_flush_blacklisted_tokens(self):
+        token = RefreshToken.for_user(self.user)
+        token.blacklist()
+        with patch.object(BlacklistedToken.objects, 'bulk_create', side_effect=DatabaseError), \
+                self.assertRaises(DatabaseError):
+            tasks.flush_blacklisted_tokens()
+        assert not BlacklistedToken.objects.filter(token__jti=token['jti']).exists()
+        # the failed batch is kept until it times out, then copied by the next run
+        tasks.flush_blacklisted_tokens()
+        assert not BlacklistedToken.objects.filter(token__jti=token['jti']).exists()
+        with override_settings(TOKEN_BLACKLIST_PROCESSING_TIMEOUT=0):
+            tasks.flush_blacklisted_tokens()
+        assert BlacklistedToken.objects.filter(token__jti=token['jti']).exists()
+        assert redis_client.zcard(BLACKLIST_PROCESSING_KEY) == 0
+
+    def test_prune_expired_tokens(self):
+        now = timezone.now()
+        OutstandingToken.objects.bulk_create([
+            OutstandingToken(jti=f'expired-{i}', token='', expires_at=now - timezone.timedelta(days=1))
+            for i in range(5)
+        ] + [OutstandingToken(jti='alive', token='', expires_at=now + timezone.timedelta(days=1))])
+        tasks.prune_expired_tokens(batch_size=2)
+        assert list(OutstandingToken.objects.filter(jti__in=['alive', 'expired-0']).values_list('jti', flat=True)) == ['alive']
+
+    def test_authentication_uses_cached_user(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        request = self.factory.get('profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        authentication = CachedJWTAuthentication()
+        authentication.authenticate(request)
+        with self.assertNumQueries(0):
+            user, _ = authentication.authenticate(request)
+        assert user.pk == self.user.pk and user.username == 'username'
+
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaises(AuthenticationFailed):
+            authentication.authenticate(request)
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_authentication_uses_redis_snapshot(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        request = self.factory.get('profile/', HTTP_AUTHORIZATION=f'Bearer {access}')
+        authentication = CachedJWTAuthentication()
+        authentication.authenticate(request)
+        user_snapshots.clear()
+        with self.assertNumQueries(0):
+            authentication.authenticate(request)
+
+    def test_change_password_with_cached_user(self):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        data = {'old_password': 'pimp', 'new_password': '1234', 'new_password_confirm': '1234'}
+        request = self.factory.post('change_password/', data, format='json',
+                                    HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = views.ChangePasswordView.as_view()(request)
+        assert response.status_code == 200
+        assert User.objects.get(pk=self.user.pk).check_password('1234')
+
+    def test_create_user_single_insert(self):
+        with self.assertNumQueries(1):
+            user = User.objects.create_user(
+                email='single@gmail.com', username='single', password='pimp')
+        assert user.slug == 'single' and user.activation_code
+        with self.assertNumQueries(1):
+            admin = User.objects.create_superuser(
+                email='admin@gmail.com', username='admin', password='pimp')
+        assert admin.is_active and admin.is_staff and admin.is_superuser
+
+    def test_bulk_create_users(self):
+        users_data = [
+            {'email': f'bulk{i}@gmail.com', 'username': f'bulk_{i}', 'password': 'pimp'}
+            for i in range(20)
+        ]
+        with self.assertNumQueries(1):
+            User.objects.bulk_create_users(users_data)
+        user = User.objects.get(username='bulk_3')
+        assert user.slug == 'bulk-3' and user.activation_code and user.check_password('pimp')
+
+    def test_profile_image_variants(self):
+        photo = Image.new('RGB', (1200, 800), 'red')
+        exif = Image.Exif()
+        exif[0x010f] = 'Camera maker'
+        upload = io.BytesIO()
+        photo.save(upload, format='JPEG', exif=exif)
+        data = {'competence': 'Photo', 'language': 'En'}
+        user = User.objects.create_user(email='photo@gmail.com', username='photo', password='pimp')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            request = self.factory.post('profile/', {
+                **data, 'image': SimpleUploadedFile('me.jpg', upload.getvalue(), 'image/jpeg')})
+            force_authenticate(request, user=user)
+            response = views.ProfileView.as_view({'post': 'create'})(request)
+            request.close()
+            assert response.status_code == 201
+            assert response.data['image_variants'] == {}
+            profile = Profile.objects.get(pk=response.data['id'])
+            event = OutboxEvent.objects.get(task=tasks.process_profile_image.name)
+            assert event.args == [profile.pk, profile.image.name]
+
+            tasks.process_profile_image(*event.args)
+            profile.refresh_from_db()
+            assert set(profile.image_variants) == {'small', 'medium', 'large'}
+            with Image.open(os.path.join(media_root, profile.image_variants['large']['webp'])) as large:
+                assert large.format == 'WEBP' and large.size == (512, 512)
+            with Image.open(os.path.join(media_root, profile.image_variants['small']['jpeg'])) as small:
+                assert small.size == (64, 64) and not small.getexif()
+
+            request = self.factory.get('profile/')
+            response = views.ProfileView.as_view({'get': 'retrieve'})(request, pk=profile.pk)
+            assert response.data['image_variants']['small']['webp'].endswith(
+                profile.image_variants['small']['webp'])
+
+            # the same upload again reuses the stored variants
+            other = Profile.objects.create(user=User.objects.create_user(
+                email='copy@gmail.com', username='copy', password='pimp'),
+                image=SimpleUploadedFile('copy.jpg', upload.getvalue(), 'image/jpeg'))
+            tasks.process_profile_image(other.pk, other.image.name)
+            other.refresh_from_db()
+            assert other.image_variants == profile.image_variants
+
+            # variants of a replaced image are not recorded
+            Profile.objects.filter(pk=other.pk).update(image='media/new.jpg', image_variants={})
+            tasks.process_profile_image(other.pk, other.image.name)
+            other.refresh_from_db()
+            assert other.image_variants == {}
+
+    def test_profile_image_upload_limits(self):
+        user = User.objects.create_user(email='photo@gmail.com', username='photo', password='pimp')
+        view = views.ProfileView.as_view({'post': 'create'})
+        png = io.BytesIO()
+        Image.new('RGB', (300, 300), 'blue').save(png, format='PNG')
+        with tempfile.TemporaryDirectory() as media_root, override_settings(
+                MEDIA_ROOT=media_root, UPLOAD_MAX_SIZE=len(png.getvalue()) - 1):
+            for content, status in ((png.getvalue(), 413), (b'MZ\x90\x00' + b'\x00' * 100, 415)):
+                request = self.factory.post('profile/', {
+                    'language': 'En', 'image': SimpleUploadedFile('me.png', content, 'image/png')})
+                force_authenticate(request, user=user)
+                assert view(request).status_code == status
+            assert not Profile.objects.filter(user=user).exists()
+            assert not os.listdir(media_root)
+
+    @override_settings(MEDIA_X_ACCEL_REDIRECT=True)
+    def test_media_served_by_nginx(self):
+        response = self.client.get('/media/avatars/ab/abc/small.webp')
+        assert response['X-Accel-Redirect'] == '/protected-media/avatars/ab/abc/small.webp'
+        assert response['Content-Type'] == 'image/webp'
+        assert 'immutable' in response['Cache-Control']
+        assert not response.content
+        assert self.client.get('/media/../core/settings.py').status_code == 404
+
+    def test_profile_read_serializer_matches_full_serializer(self):
+        profile = Profile.objects.get(user=self.user)
+        profile.image = 'media/me.jpg'
+        profile.image_variants = {'small': {'webp': 'avatars/ab/abc/small.webp'}}
+        profile.competence = 'Python'
+        profile.save()
+        request = APIRequestFactory().get('profile/')
+        row = Profile.objects.values(*serializers.ProfileReadSerializer.values_fields()).get(pk=profile.pk)
+        lean = serializers.ProfileReadSerializer(row, context={'request': request}).data
+        full = serializers.ProfileSerializer(profile, context={'request': request}).data
+        assert json.dumps(lean) == json.dumps(full)
+        assert lean['image'] == 'http://testserver/media/media/me.jpg'
+
+        response = views.ProfileView.as_view({'get': 'list'})(request)
+        assert response.data['results'] == [full]
+        schema = self.client.get('/docs/?format=openapi').json()
+        assert 'fields' in {param['name'] for param in schema['paths']['/profile/']['get']['parameters']}
+
+    def test_profile_list_pagination(self):
+        users = User.objects.bulk_create_users([
+            {'email': f'list{i}@gmail.com', 'username': f'list_{i}', 'password': None}
+            for i in range(30)
+        ])
+        Profile.objects.bulk_create([Profile(user=user, language='Ru') for user in users])
+        view = views.ProfileView.as_view({'get': 'list'})
+        for page_size in (5, 25):
+            request = self.factory.get('profile/', {'page_size': page_size})
+            with self.assertNumQueries(1):
+                response = view(request)
+            assert len(response.data['results']) == page_size
+            assert response.data['next']
+        request = self.factory.get(response.data['next'])
+        response = view(request)
+        assert len(response.data['results']) == 6
+        assert response.data['next'] is None
+
+    @override_settings(ACCOUNT_CODE_STORE='account.codes.DatabaseCodeStore')
+    def test_forgot_password_queries(self):
+        request = self.factory.post('forgot-password/', {'email': 'pimp@gmail.com'}, format='json')
+        force_authenticate(request, user=self.user)
+        view = views.ForgotPasswordView.as_view()
+        with patch.object(tasks.send_password_reset_code_celery, 'delay') as send:
+            with self.assertNumQueries(2):
+                response = view(request)
+        assert response.status_code == 200
+        code = User.objects.get(pk=self.user.pk).activation_code
+        send.assert_called_once_with('pimp@gmail.com', code)
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_deliver_reuses_connection(self):
+        conn = mail.PersistentConnection()
+        messages = [mail.activation_message(f'user{i}@gmail.com', 'code') for i in range(3)]
+        with patch('account.mail.get_connection', wraps=django_mail.get_connection) as get_connection, \
+                patch.object(locmem.EmailBackend, 'send_messages', autospec=True,
+                             side_effect=locmem.EmailBackend.send_messages) as send_messages:
+            assert mail.deliver(messages, conn=conn) == 3
+        get_connection.assert_called_once()
+        send_messages.assert_called_once()
+        assert django_mail.outbox[0].to == ['user0@gmail.com']
+        assert django_mail.outbox[0].alternatives[0][1] == 'text/html'
+
+    @override_settings(EMAIL_BACKEND='account.tests.FlakySMTPBackend')
+    def test_deliver_handles_failures_per_message(self):
+        conn = mail.PersistentConnection()
+        messages = [mail.password_reset_message(email, 'code') for email in (
+            'first@gmail.com', 'refused@gmail.com', 'drop@gmail.com', 'last@gmail.com')]
+        FlakySMTPBackend.batches, FlakySMTPBackend.dropped = [], False
+        with patch('account.mail.get_connection', wraps=django_mail.get_connection) as get_connection, \
+                patch('account.mail._schedule_retry') as schedule_retry, \
+                self.assertLogs('account.mail', level='ERROR'):
+            assert mail.deliver(messages, conn=conn) == 3
+        # the refused message is retried later; after the dropped connection
+        # the rest goes out again over a new one, without resending the first
+        schedule_retry.assert_called_once_with(messages[1])
+        assert [email.to[0] for email in django_mail.outbox] == [
+            'first@gmail.com', 'drop@gmail.com', 'last@gmail.com']
+        assert FlakySMTPBackend.batches == [4, 2, 2]
+        assert get_connection.call_count == 2
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_deliver_schedules_retry(self):
+        conn = mail.PersistentConnection()
+        message = mail.password_reset_message('retry@gmail.com', 'code')
+        with patch.object(conn, 'send_messages',
+                          side_effect=lambda emails: [(emails[0], smtplib.SMTPDataError(451, 'try later'))]), \
+                self.assertLogs('account.mail', level='ERROR'):
+            assert mail.deliver([message], conn=conn) == 0
+        retries = [json.loads(item) for item in redis_client.zrange(mail.MAIL_RETRY_KEY, 0, -1)]
+        redis_client.delete(mail.MAIL_RETRY_KEY)
+        assert {**message, 'attempts': 1} in retries
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def test_flush_keeps_batch_until_sent(self):
+        messages = [mail.password_reset_message(f'user{i}@gmail.com', 'code') for i in range(3)]
+        redis_client.rpush(mail.MAIL_QUEUE_KEY, *(json.dumps(message) for message in messages))
+        try:
+            with patch('account.mail.deliver', side_effect=RuntimeError('worker died')):
+                with self.assertRaises(RuntimeError):
+                    mail.flush()
+            assert redis_client.llen(mail.MAIL_QUEUE_KEY) == 0
+            assert redis_client.zcard(mail.MAIL_PROCESSING_KEY) == 1
+            assert mail.requeue_stalled() == 0
+            with override_settings(EMAIL_PROCESSING_TIMEOUT=0):
+                assert mail.requeue_stalled() == 3
+            assert [json.loads(item) for item in redis_client.lrange(mail.MAIL_QUEUE_KEY, 0, -1)] == messages
+            with patch('account.mail.connection', mail.PersistentConnection()):
+                assert mail.flush() == 3
+            assert [email.to for email in django_mail.outbox] == [message['to'] for message in messages]
+            assert redis_client.zcard(mail.MAIL_PROCESSING_KEY) == 0
+            assert not redis_client.keys(f'{mail.MAIL_PROCESSING_KEY}:*')
+        finally:
+            redis_client.delete(mail.MAIL_QUEUE_KEY, mail.MAIL_PROCESSING_KEY)
+
+    def test_expire_password_reset_codes(self):
+        stale = timezone.now() - timezone.timedelta(minutes=5)
+        User.objects.filter(pk=self.user.pk).update(activation_code='stale', activation_code_created_at=stale)
+        fresh = User.objects.create_user(
+            email='fresh@gmail.com', username='fresh', password='pimp', is_active=True)
+        with self.assertNumQueries(1):
+            assert tasks.expire_password_reset_codes() == 1
+        assert User.objects.get(pk=self.user.pk).activation_code is None
+        assert User.objects.get(pk=fresh.pk).activation_code == fresh.activation_code
+
+        # tasks queued by the previous release still run
+        User.objects.filter(pk=self.user.pk).update(activation_code='stale', activation_code_created_at=stale)
+        assert tasks.delete_activation_code(fresh.pk) == 0
+        assert tasks.delete_activation_code(self.user.pk) == 1
+        assert User.objects.get(pk=self.user.pk).activation_code is None
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_redis_code_store(self):
+        store = RedisCodeStore()
+        code = store.issue(self.user, 'reset')
+        assert store.check(self.user.email, 'reset', code)
+        assert not store.check(self.user.email, 'reset', 'wrong')
+        with self.assertNumQueries(0):
+            assert not store.consume(self.user.email, 'reset', 'wrong')
+            assert store.consume(self.user.email, 'reset', code)
+        assert not store.consume(self.user.email, 'reset', code)
+
+    def test_forgot_password_flow(self):
+        request = self.factory.post('forgot-password/', {'email': 'pimp@gmail.com'}, format='json')
+        force_authenticate(request, user=self.user)
+        with patch.object(tasks.send_password_reset_code_celery, 'delay') as send:
+            views.ForgotPasswordView.as_view()(request)
+        code = send.call_args.args[1]
+        data = {'email': 'pimp@gmail.com', 'code': code, 'password': 'passw', 'password_confirm': 'passw'}
+        view = views.ForgotPasswordCompleteView.as_view()
+        for status_code in (200, 400):
+            request = self.factory.post('forgot_password_complete/', data, format='json')
+            force_authenticate(request, user=self.user)
+            response = view(request)
+            assert response.status_code == status_code
+        assert User.objects.get(pk=self.user.pk).check_password('passw')
+
+    def test_register_writes_outbox_event(self):
+        data = {
+            'email': 'outbox@gmail.com',
+            'password': '5432',
+            'password_confirm': '5432',
+            'first_name': 'test_name',
+            'last_name': 'test_last_name',
+            'username': 'outbox_user'
+        }
+        with patch.object(tasks.send_activation_code_celery, 'delay') as delay:
+            response = views.RegistrationView.as_view()(self.factory.post('register/', data, format='json'))
+        assert response.status_code == 200
+        delay.assert_not_called()
+        user = User.objects.get(email=data['email'])
+        event = OutboxEvent.objects.get()
+        assert event.task == tasks.send_activation_code_celery.name
+        assert event.args == [user.email, user.activation_code]
+
+        with patch('account.outbox.app.send_task') as send_task:
+            assert outbox.relay(batch_size=1) == 1
+        send_task.assert_called_once()
+        assert send_task.call_args.args == (event.task,)
+        assert send_task.call_args.kwargs['args'] == event.args
+        assert not OutboxEvent.objects.exists()
+
+    def test_retrieve_profile_cached_with_etag(self):
+        profile = Profile.objects.get(user=self.user)
+        view = views.ProfileView.as_view({'get': 'retrieve', 'patch': 'partial_update'})
+        response = view(self.factory.get(f'profile/{profile.id}/'), pk=profile.id)
+        assert response.status_code == 200 and response.data['language'] == 'En'
+        etag = response['ETag']
+        with self.assertNumQueries(0):
+            response = view(self.factory.get(f'profile/{profile.id}/'), pk=profile.id)
+            assert response.status_code == 200 and response.data['language'] == 'En'
+            response = view(self.factory.get(f'profile/{profile.id}/', HTTP_IF_NONE_MATCH=etag), pk=profile.id)
+            assert response.status_code == 304
+
+        request = self.factory.patch(f'profile/{profile.id}/', {'language': 'Ru'}, format='json')
+        force_authenticate(request, user=self.user)
+        assert view(request, pk=profile.id).status_code == 200
+        response = view(self.factory.get(f'profile/{profile.id}/', HTTP_IF_NONE_MATCH=etag), pk=profile.id)
+        assert response.status_code == 200 and response.data['language'] == 'Ru'
+        assert response['ETag'] != etag
+
+        # unknown ids get no version key, and * is not a match for them
+        missing = profile.id + 1000
+        response = view(self.factory.get(f'profile/{missing}/', HTTP_IF_NONE_MATCH='*'), pk=missing)
+        assert response.status_code == 404
+        assert cache.get(PROFILE_VERSION_KEY.format(missing)) is None
+
+    def test_hidden_profile_is_shown_to_owner_only(self):
+        profile = Profile.objects.get(user=self.user)
+        other = User.objects.create_user(
+            email='other@gmail.com', username='other', password='pimp', is_active=True)
+        view = views.ProfileView.as_view({'get': 'retrieve', 'patch': 'partial_update'})
+
+        def retrieve(user=None):
+            request = self.factory.get(f'profile/{profile.id}/')
+            if user is not None:
+                force_authenticate(request, user=user)
+            return view(request, pk=profile.id)
+
+        # cached while public, then hidden by the owner
+        assert retrieve().status_code == 200
+        request = self.factory.patch(f'profile/{profile.id}/', {'is_hidden': True}, format='json')
+        force_authenticate(request, user=self.user)
+        assert view(request, pk=profile.id).status_code == 200
+
+        for _ in range(2):
+            response = retrieve(self.user)
+            assert response.status_code == 200 and response.data['is_hidden'] is True
+            assert 'ETag' not in response
+            assert retrieve().status_code == 404
+            assert retrieve(other).status_code == 404
+
+        request = self.factory.patch(f'profile/{profile.id}/', {'is_hidden': False}, format='json')
+        force_authenticate(request, user=self.user)
+        assert view(request, pk=profile.id).status_code == 200
+        response = retrieve(other)
+        assert response.status_code == 200 and response.data['is_hidden'] is False
+
+        # a hidden profile without a version key does not get one
+        cache.delete(PROFILE_VERSION_KEY.format(profile.id))
+        Profile.objects.filter(pk=profile.id).update(is_hidden=True)
+        assert retrieve().status_code == 404
+        assert retrieve(self.user).status_code == 200
+        assert cache.get(PROFILE_VERSION_KEY.format(profile.id)) is None
+
+    def test_profile_sparse_fieldsets(self):
+        profile = Profile.objects.get(user=self.user)
+        view = views.ProfileView.as_view({'get': 'list'})
+        with CaptureQueriesContext(connection) as queries:
+            response = view(self.factory.get('profile/', {'fields': 'language, user,id'}))
+        assert response.data['results'] == [{'id': profile.id, 'user': self.user.id, 'language': 'En'}]
+        select = queries.captured_queries[-1]['sql']
+        assert '"language"' in select and '"competence"' not in select
+
+        response = view(self.factory.get('profile/', {'exclude': 'image,image_variants,updated_at'}))
+        assert 'image' not in response.data['results'][0] and 'site_url' in response.data['results'][0]
+        for params in ({'fields': 'id,password'}, {'fields': 'id', 'exclude': 'id'}):
+            assert view(self.factory.get('profile/', params)).status_code == 400
+
+        # cached retrieves are cut from the full cached representation
+        detail = views.ProfileView.as_view({'get': 'retrieve'})
+        full = detail(self.factory.get(f'profile/{profile.id}/'), pk=profile.id).data
+        response = detail(self.factory.get(f'profile/{profile.id}/', {'fields': 'id,language'}), pk=profile.id)
+        assert response.data == {'id': profile.id, 'language': 'En'}
+        assert detail(self.factory.get(f'profile/{profile.id}/'), pk=profile.id).data == full
+
+    def test_login_rehashes_legacy_password(self):
+        legacy = make_password('pimp', hasher='pbkdf2_sha256')
+        User.objects.filter(pk=self.user.pk).update(password=legacy)
+        data = {'username': 'username', 'password': 'pimp'}
+        response = TokenObtainPairView.as_view()(self.factory.post('login/', data, format='json'))
+        assert response.status_code == 200
+        password = User.objects.get(pk=self.user.pk).password
+        assert password.startswith('argon2$argon2id$')
+        assert hashing.verify('pimp', password) == (True, None)
+
+        data['password'] = 'wrong'
+        response = TokenObtainPairView.as_view()(self.factory.post('login/', data, format='json'))
+        assert response.status_code == 401
+
+    def test_hashing_backpressure(self):
+        data = {
+            'email': 'busy@gmail.com',
+            'password': '5432',
+            'password_confirm': '5432',
+            'first_name': 'test_name',
+            'last_name': 'test_last_name',
+            'username': 'busy_user'
+        }
+        with patch.object(hashing, '_slots', threading.Semaphore(0)), \
+                override_settings(PASSWORD_HASHING_QUEUE_TIMEOUT=0.01):
+            response = views.RegistrationView.as_view()(self.factory.post('register/', data, format='json'))
+        assert response.status_code == 503
+        assert not User.objects.filter(email=data['email']).exists()
+
+    @override_settings(PASSWORD_HASHING_WORKERS=2)
+    def test_hashing_pool_spawns_its_workers(self):
+        with patch.object(hashing, '_pool', None):
+            pool = hashing._get_pool()
+            try:
+                assert pool._mp_context.get_start_method() == 'spawn'
+                assert pool._max_workers == 2
+                assert hashing.verify('pimp', make_password('pimp')) == (True, None)
+            finally:
+                pool.shutdown()
+
+    def test_import_users(self):
+        rows = [
+            'username,first_name,last_name,email,password,is_mentor',
+            'school1,Ivan,Ivanov,ivan@school.kg,pass1234,',
+            'school2,Petr,Petrov,pimp@gmail.com,pass1234,',
+            'school3,Anna,Ivanova,not-an-email,pass1234,',
+            'school4,Asel,Asanova,ivan@school.kg,pass1234,',
+            'school5,Aibek,Aibekov,aibek@school.kg,pass1234,true',
+        ]
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.csv')
+            with open(path, 'w') as file:
+                file.write('\n'.join(rows))
+            with open(f'{path}.checkpoint', 'w') as file:
+                json.dump({'rows': 1}, file)
+            err = io.StringIO()
+            with patch.object(tasks.send_activation_code_celery, 'delay') as delay:
+                call_command('import_users', path, batch_size=2, stdout=io.StringIO(), stderr=err)
+            delay.assert_not_called()
+            assert not os.path.exists(f'{path}.checkpoint')
+
+        # row 1 was imported by the run that wrote the checkpoint
+        assert not User.objects.filter(username='school1').exists()
+        assert sorted(line.split(':')[0] for line in err.getvalue().splitlines()) == ['row 2', 'row 3']
+        assert set(User.objects.filter(username__startswith='school').values_list('username', flat=True)) == {
+            'school4', 'school5'}
+        user = User.objects.get(username='school5')
+        assert user.is_mentor and not user.is_active and user.check_password('pass1234')
+        assert user.slug == 'school5'
+        assert OutboxEvent.objects.count() == 2
+
+    def test_export_accounts(self):
+        second = User.objects.create_user(email='second@gmail.com', username='second', password='pimp')
+        view = views.AccountExportView.as_view()
+        request = self.factory.get('export/')
+        force_authenticate(request, user=self.user)
+        assert view(request).status_code == 403
+
+        admin = User.objects.create_superuser(email='admin@gmail.com', username='admin', password='pimp')
+        request = self.factory.get('export/', {'columns': 'id,email,profile__language'})
+        force_authenticate(request, user=admin)
+        response = view(request)
+        assert response.status_code == 200 and response.streaming
+        rows = list(csv.reader(io.StringIO(b''.join(response.streaming_content).decode())))
+        assert rows == [
+            ['id', 'email', 'profile__language'],
+            [str(self.user.id), 'pimp@gmail.com', 'En'],
+            [str(second.id), 'second@gmail.com', ''],
+            [str(admin.id), 'admin@gmail.com', ''],
+        ]
+
+        request = self.factory.get('export/', {
+            'output': 'jsonl', 'gzip': 'true', 'columns': 'username',
+            'joined_after': second.date_joined.isoformat(), 'joined_before': admin.date_joined.isoformat()})
+        force_authenticate(request, user=admin)
+        response = view(request)
+        assert response['Content-Type'] == 'application/gzip'
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        assert [json.loads(line) for line in lines] == [{'username': 'second'}]
+
+        request = self.factory.get('export/', {'columns': 'password'})
+        force_authenticate(request, user=admin)
+        assert view(request).status_code == 400
+
+    def test_export_accounts_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'accounts.jsonl.gz')
+            call_command('export_accounts', output=path, columns='email,is_active', stderr=io.StringIO())
+            with gzip.open(path, 'rt') as file:
+                assert [json.loads(line) for line in file] == [{'email': 'pimp@gmail.com', 'is_active': True}]
+
+    @override_settings(PROFILE_CHANGES_SETTLE=0)
+    def test_profile_changes_feed(self):
+        view = views.ProfileView.as_view({'get': 'changes'})
+        profile = Profile.objects.get(user=self.user)
+        other = Profile.objects.create(user=User.objects.create_user(
+            email='other@gmail.com', username='other', password='pimp'))
+
+        response = view(self.factory.get('profile/changes/', {'page_size': 1}))
+        assert [(change['op'], change['id']) for change in response.data['results']] == [('upsert', profile.id)]
+        assert response.data['has_more']
+        response = view(self.factory.get('profile/changes/', {'since': response.data['next']}))
+        assert [(change['op'], change['id']) for change in response.data['results']] == [('upsert', other.id)]
+        assert response.data['results'][0]['profile']['user'] == other.user_id
+        assert not response.data['has_more']
+        cursor = response.data['next']
+
+        profile.language = 'Ru'
+        profile.save()
+        other_id = other.id
+        other.delete()
+        with self.assertNumQueries(2):
+            response = view(self.factory.get('profile/changes/', {'since': cursor}))
+        assert [(change['op'], change['id']) for change in response.data['results']] == [
+            ('upsert', profile.id), ('delete', other_id)]
+        assert response.data['results'][0]['profile']['language'] == 'Ru'
+        response = view(self.factory.get('profile/changes/', {'since': response.data['next']}))
+        assert response.data['results'] == []
+
+        ProfileTombstone.objects.update(deleted_at=timezone.now() - timezone.timedelta(days=31))
+        assert tasks.prune_profile_tombstones() == 1
+        stale = changes.encode_cursor((timezone.now() - timezone.timedelta(days=31), changes.UPSERT, 0))
+        assert view(self.factory.get('profile/changes/', {'since': stale})).status_code == 410
+        assert view(self.factory.get('profile/changes/', {'since': 'garbage'})).status_code == 400
+        naive = base64.urlsafe_b64encode(b'["2026-01-01T00:00:00", 0, 1]').decode()
+        assert view(self.factory.get('profile/changes/', {'since': naive})).status_code == 400
+
+    def create_mentors(self):
+        mentors = {}
+        for username, first_name, competence, language in (
+            ('guitar_guru', 'Aibek', 'guitar music theory', 'Kg'),
+            ('py_master', 'Asel', 'python django postgres', 'Ru'),
+            ('data_dina', 'Dina', 'python data analytics', 'En'),
+        ):
+            mentor = User.objects.create_user(
+                email=f'{username}@gmail.com', username=username, first_name=first_name,
+                password='pimp', is_mentor=True, is_active=True, experience='Онлайн')
+            Profile.objects.create(user=mentor, competence=competence, language=language)
+            mentors[username] = mentor
+        User.objects.create_user(
+            email='hidden@gmail.com', username='python_inactive', password='pimp', is_mentor=True)
+        return mentors
+
+    def test_mentor_search(self):
+        mentors = self.create_mentors()
+        view = views.MentorSearchView.as_view()
+
+        response = view(self.factory.get('mentors/', {'page_size': 2}))
+        assert [mentor['username'] for mentor in response.data['results']] == ['guitar_guru', 'py_master']
+        assert response.data['results'][0]['competence'] == 'guitar music theory'
+        response = view(self.factory.get(response.data['next']))
+        assert [mentor['username'] for mentor in response.data['results']] == ['data_dina']
+        assert response.data['next'] is None
+
+        response = view(self.factory.get('mentors/', {'q': 'python'}))
+        assert {mentor['id'] for mentor in response.data['results']} == {
+            mentors['py_master'].id, mentors['data_dina'].id}
+        response = view(self.factory.get('mentors/', {'q': 'python', 'language': 'En'}))
+        assert [mentor['username'] for mentor in response.data['results']] == ['data_dina']
+        response = view(self.factory.get('mentors/', {'audience': 'Нет'}))
+        assert response.data['results'] == []
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_mentor_search_ranking(self):
+        self.create_mentors()
+        view = views.MentorSearchView.as_view()
+        # py_master matches both words, data_dina one
+        response = view(self.factory.get('mentors/', {'q': 'python or django'}))
+        assert [mentor['username'] for mentor in response.data['results']] == ['py_master', 'data_dina']
+        profile = Profile.objects.get(user__username='data_dina')
+        profile.competence = 'django'
+        profile.save()
+        response = view(self.factory.get('mentors/', {'q': 'python'}))
+        assert [mentor['username'] for mentor in response.data['results']] == ['py_master']
+
+    @skipUnless(connection.vendor == 'postgresql', 'full-text search needs PostgreSQL')
+    def test_mentor_search_pages_through_rank_ties(self):
+        mentors = self.create_mentors()
+        for i in range(5):
+            twin = User.objects.create_user(
+                email=f'twin{i}@gmail.com', username=f'twin{i}', password='pimp',
+                is_mentor=True, is_active=True)
+            Profile.objects.create(user=twin, competence='python django postgres')
+            mentors[twin.username] = twin
+        view = views.MentorSearchView.as_view()
+        response = view(self.factory.get('mentors/', {'q': 'python', 'page_size': 2}))
+        seen = [mentor['username'] for mentor in response.data['results']]
+        while response.data['next']:
+            response = view(self.factory.get(response.data['next']))
+            seen += [mentor['username'] for mentor in response.data['results']]
+        assert len(seen) == len(set(seen)) == 7
+        assert set(seen) == set(mentors) - {'guitar_guru'}
+
+    @skipUnless(pg_extension_installed('pg_trgm'), 'fuzzy username search needs pg_trgm')
+    def test_mentor_search_fuzzy_username(self):
+        self.create_mentors()
+        response = views.MentorSearchView.as_view()(self.factory.get('mentors/', {'username': 'gitar_guru'}))
+        assert [mentor['username'] for mentor in response.data['results']] == ['guitar_guru']
+
+    @override_settings(AVAILABILITY_FILTER='account.availability.LocalBloomFilter')
+    def test_availability(self):
+        view = views.AvailabilityView.as_view()
+        availability.get_availability_filter().rebuild()
+        with self.assertNumQueries(0):
+            response = view(self.factory.get('availability/', {'username': 'free_name', 'email': 'free@gmail.com'}))
+        assert response.data == {'username': True, 'email': True}
+        response = view(self.factory.get('availability/', {'username': 'username', 'email': 'PIMP@gmail.com'}))
+        assert response.data == {'username': False, 'email': True}
+        response = view(self.factory.get('availability/', {'email': 'pimp@GMAIL.com'}))
+        assert response.data == {'email': False}
+
+        User.objects.create_user(email='fresh@gmail.com', username='Fresh Name', password='pimp')
+        response = view(self.factory.get('availability/', {'username': 'fresh-name'}))
+        assert response.data == {'username': False}
+        assert view(self.factory.get('availability/')).status_code == 400
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_redis_availability_filter(self):
+        bloom = availability.RedisBloomFilter()
+        redis_client.delete(availability.FILTER_KEY, availability.REBUILD_LOCK_KEY)
+        bloom.add(['username:ghost'])
+        assert not redis_client.exists(availability.FILTER_KEY)
+        # a missing filter reads as unknown and schedules one rebuild, run inline here
+        rebuild = tasks.rebuild_availability_filter
+        with patch.object(rebuild, 'delay', side_effect=lambda: rebuild()) as delay:
+            assert bloom.might_contain('username:username') is None
+            assert bloom.might_contain('username:username') is True
+        delay.assert_called_once_with()
+        assert bloom.might_contain('username:nobody') is False
+        availability.add_users([User(username='late', email='late@gmail.com', slug='late')])
+        assert bloom.might_contain('email:late@gmail.com') is True
+        assert not redis_client.exists(availability.REBUILD_LOCK_KEY)
+
+    async def test_async_register(self):
+        data = {
+            'email': 'async@gmail.com',
+            'password': '5432',
+            'password_confirm': '5432',
+            'first_name': 'test_name',
+            'last_name': 'test_last_name',
+            'username': 'async_user'
+        }
+        request = AsyncRequestFactory().post('register/', data, content_type='application/json')
+        response = await async_views.RegistrationView.as_view()(request)
+        assert response.status_code == 200
+        user = await User.objects.aget(email=data['email'])
+        assert user.check_password('5432') and not user.is_active
+        assert await OutboxEvent.objects.filter(args=[user.email, user.activation_code]).aexists()
+
+        request = AsyncRequestFactory().post('register/', data, content_type='application/json')
+        response = await async_views.RegistrationView.as_view()(request)
+        assert response.status_code == 400
+        assert 'email' in json.loads(response.content)
+
+    def test_async_views_skip_csrf_checks(self):
+        client = Client(enforce_csrf_checks=True)
+        data = {
+            'email': 'csrf@gmail.com', 'password': '5432', 'password_confirm': '5432',
+            'first_name': 'test_name', 'last_name': 'test_last_name', 'username': 'csrf_user',
+        }
+        response = client.post('/api/v1/async/register/', data, content_type='application/json')
+        assert response.status_code == 200
+        response = client.post('/api/v1/async/logout/', {}, content_type='application/json')
+        assert response.status_code == 401
+
+    def test_asgi_middleware_chain_stays_async(self):
+        chain = ASGIHandler()._middleware_chain
+        assert not isinstance(chain, SyncToAsync) and iscoroutinefunction(chain)
+
+    async def test_async_write_pins_client_to_primary(self):
+        data = {
+            'email': 'pinned@gmail.com', 'password': '5432', 'password_confirm': '5432',
+            'first_name': 'test_name', 'last_name': 'test_last_name', 'username': 'pinned_user',
+        }
+        response = await AsyncClient().post('/api/v1/async/register/', data, content_type='application/json')
+        assert response.status_code == 200
+        assert PIN_COOKIE in response.cookies
+
+    async def test_async_profile_list(self):
+        users = [
+            User(email=f'async{i}@gmail.com', username=f'async{i}', slug=f'async{i}', password='x')
+            for i in range(3)
+        ]
+        await User.objects.abulk_create(users)
+        await Profile.objects.abulk_create([
+            Profile(user=user) async for user in User.objects.filter(email__startswith='async')])
+        view = async_views.ProfileListView.as_view()
+        response = await view(AsyncRequestFactory().get('profile/', {'page_size': 3}))
+        page = json.loads(response.content)
+        assert response.status_code == 200 and len(page['results']) == 3
+        response = await view(AsyncRequestFactory().get('profile/', {'after': page['after']}))
+        page = json.loads(response.content)
+        assert len(page['results']) == 1 and page['after'] is None
+
+    async def test_async_logout_requires_authentication(self):
+        request = AsyncRequestFactory().post('logout/', {}, content_type='application/json')
+        response = await async_views.APILogoutView.as_view()(request)
+        assert response.status_code == 401
+
+
+class ConnectionPoolTest(SimpleTestCase):
+
+    def test_reuses_connections(self):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:'), max_size=2, timeout=0.1)
+        first = pool.getconn()
+        pool.putconn(first)
+        assert pool.getconn() is first
+        assert pool.stats()['created'] == 1
+        assert pool.stats()['checkouts'] == 2
+        assert pool.stats()['saturation'] == 0.5
+
+    def test_times_out_when_exhausted(self):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:'), max_size=1, timeout=0.05)
+        conn = pool.getconn()
+        with self.assertRaises(PoolTimeout):
+            pool.getconn()
+        pool.putconn(conn, discard=True)
+        pool.getconn()
+        stats = pool.stats()
+        assert stats['timeouts'] == 1 and stats['discarded'] == 1 and stats['created'] == 2
+
+    def test_discards_dead_idle_connections(self):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:'), max_size=1, timeout=0.1,
+                              check_after=0, check=lambda conn: False)
+        conn = pool.getconn()
+        pool.putconn(conn)
+        assert pool.getconn() is not conn
+
+    @skipUnless(redis_available(), 'Redis is not available')
+    def test_stats_of_all_processes_are_aggregated(self):
+        pool = ConnectionPool(lambda: sqlite3.connect(':memory:'), max_size=2, timeout=0.1)
+        pool.getconn()
+        other = {'host': 'celery-1', 'pid': 7, 'pools': {'default': {
+            **pool.stats(), 'max_size': 10, 'in_use': 3, 'checkouts': 3, 'avg_wait_ms': 4.0, 'max_wait_ms': 9.0}}}
+        other_key = pool_backend.STATS_KEY.format('celery-1', 7)
+        redis_client.set(other_key, json.dumps(other))
+        try:
+            with patch.dict(pool_backend._pools, {('default', os.getpid()): pool}):
+                pool_backend.publish_stats()
+            stats = pool_backend.published_stats()
+        finally:
+            redis_client.delete(other_key, pool_backend.STATS_KEY.format(socket.gethostname(), os.getpid()))
+        assert len(stats['processes']) == 2
+        total = stats['totals']['default']
+        assert total['processes'] == 2 and total['max_size'] == 12 and total['in_use'] == 4
+        assert total['checkouts'] == 4 and total['max_wait_ms'] == 9.0
+        self.assertAlmostEqual(total['avg_wait_ms'], 3.0, places=2)
+        assert total['saturation'] == 4 / 12
+
+
+class JSONAndCompressionTest(SimpleTestCase):
+
+    def test_orjson_renderer_matches_drf(self):
+        data = {
+            'id': 1, 'name': 'Асель', 'price': Decimal('9.50'), 'tags': ('a', 'b'),
+            'joined': timezone.now(), 'day': timezone.now().date(), 'nothing': None,
+            'nested': [{'separator': 'a\u2028b'}], 2: 'int key',
+        }
+        assert ORJSONRenderer().render(data) == JSONRenderer().render(data)
+        assert ORJSONRenderer().render(None) == b''
+        assert ORJSONRenderer().render({'a': 1}, 'application/json; indent=4') == b'{\n  "a": 1\n}'
+
+    def test_orjson_parser(self):
+        parser = ORJSONParser()
+        assert parser.parse(io.BytesIO('{"name": "Асель"}'.encode())) == {'name': 'Асель'}
+        assert parser.parse(io.BytesIO('{"a": 1}'.encode('utf-16')), parser_context={'encoding': 'utf-16'}) == {'a': 1}
+        for body in (b'{"a": ', b'{"a": NaN}'):
+            with self.assertRaises(ParseError):
+                parser.parse(io.BytesIO(body))
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_compression_middleware_under_async_view(self):
+        body = json.dumps([{'id': i, 'username': f'user{i}'} for i in range(50)]).encode()
+
+        async def view(request):
+            return HttpResponse(body, content_type='application/json')
+
+        middleware = CompressionMiddleware(view)
+        assert iscoroutinefunction(middleware)
+        response = async_to_sync(middleware)(APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == body
+
+    @override_settings(COMPRESSION_MIN_SIZE=100)
+    def test_compression_middleware(self):
+        factory = APIRequestFactory()
+        body = json.dumps([{'id': i, 'username': f'user{i}'} for i in range(50)]).encode()
+
+        def view(request):
+            response = HttpResponse(body, content_type='application/json')
+            response['ETag'] = '"v1"'
+            return response
+
+        response = CompressionMiddleware(view)(factory.get('/', HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.5, br;q=0'))
+        assert response['Content-Encoding'] == 'gzip'
+        assert gzip.decompress(response.content) == body
+        assert response['Content-Length'] == str(len(response.content))
+        assert response['ETag'] == 'W/"v1"' and response['Vary'] == 'Accept-Encoding'
+
+        for request in (factory.get('/'), factory.get('/', HTTP_ACCEPT_ENCODING='gzip;q=0')):
+            assert not CompressionMiddleware(view)(request).has_header('Content-Encoding')
+        small = CompressionMiddleware(lambda request: HttpResponse(b'{}', content_type='application/json'))
+        assert not small(factory.get('/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding')
+        streaming = CompressionMiddleware(lambda request: StreamingHttpResponse([body], content_type='text/csv'))
+        assert not streaming(factory.get('/', HTTP_ACCEPT_ENCODING='gzip')).has_header('Content-Encoding')
+
+    @skipUnless(brotli is not None, 'brotli is not installed')
+    def test_compression_middleware_prefers_brotli(self):
+        body = json.dumps([{'id': i, 'username': f'user{i}'} for i in range(50)]).encode()
+        middleware = CompressionMiddleware(lambda request: HttpResponse(body, content_type='application/json'))
+        response = middleware(APIRequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, deflate, br'))
+        assert response['Content-Encoding'] == 'br'
+        assert brotli.decompress(response.content) == body
+
+
+@patch('core.db.router.replica_available', return_value=True)
+class PrimaryReplicaRouterTest(SimpleTestCase):
+
+    def setUp(self):
+        self.router = PrimaryReplicaRouter()
+
+    def run_isolated(self, func):
+        return contextvars.Context().run(func)
+
+    def test_reads_go_to_replica_only_when_enabled(self, _):
+        def route():
+            outside = self.router.db_for_read(User)
+            with replica_reads():
+                inside = self.router.db_for_read(User)
+            return outside, inside
+        assert self.run_isolated(route) == ('default', 'replica')
+
+    def test_write_pins_to_primary(self, _):
+        def route():
+            with replica_reads():
+                self.router.db_for_write(User)
+                return self.router.db_for_read(User)
+        assert self.run_isolated(route) == 'default'
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_cached_profile_is_built_from_primary(self, _):
+        def build():
+            return {'user': 1, 'db': self.router.db_for_read(Profile)}
+
+        def read():
+            with replica_reads():
+                return get_or_build_profile(1, 'v1', 'testserver', build)
+        assert self.run_isolated(read)['db'] == 'default'
+
+    def test_middleware_pins_client_after_write(self, _):
+        factory = APIRequestFactory()
+
+        def write_view(request):
+            self.router.db_for_write(User)
+            return HttpResponse()
+
+        def read_view(request):
+            with replica_reads():
+                return HttpResponse(self.router.db_for_read(User))
+
+        response = self.run_isolated(lambda: ReplicaRoutingMiddleware(write_view)(factory.post('/')))
+        assert PIN_COOKIE in response.cookies
+        response = self.run_isolated(lambda: ReplicaRoutingMiddleware(read_view)(factory.get('/')))
+        assert response.content == b'replica'
+        request = factory.get('/')
+        request.COOKIES[PIN_COOKIE] = '1'
+        response = self.run_isolated(lambda: ReplicaRoutingMiddleware(read_view)(request))
+        assert response.content == b'default'
+
+
+@skipUnless(REPLICA_ALIAS in settings.DATABASES, 'needs a replica database (POSTGRES_REPLICA_HOST)')
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+@patch('core.db.router.replica_available', return_value=True)
+class ReplicaRoutingTest(TransactionTestCase):
+    # the replica is a TEST['MIRROR'] of default; rows have to be committed for its connection to see them.
+    # The test runner sets up the databases of skipped classes too, so an unconfigured alias is left out
+    databases = {'default', REPLICA_ALIAS} & settings.DATABASES.keys()
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            email='replica@gmail.com', username='replica', first_name='name',
+            last_name='last_name', password='pimp', is_active=True)
+        self.profile = Profile.objects.create(user=self.user, language='En')
+
+    def request(self, method, path, **kwargs):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections[REPLICA_ALIAS]) as replica:
+            response = getattr(self.client, method)(path, **kwargs)
+        profile_table = Profile._meta.db_table
+        return (response,
+                [query['sql'] for query in primary.captured_queries if profile_table in query['sql']],
+                [query['sql'] for query in replica.captured_queries if profile_table in query['sql']])
+
+    def test_profile_reads_are_served_by_replica(self, _):
+        response, primary, replica = self.request('get', '/api/v1/profile/')
+        assert response.status_code == 200
+        assert [row['id'] for row in response.data['results']] == [self.profile.id]
+        assert replica and not primary
+
+    def test_writes_and_reads_after_them_use_primary(self, _):
+        access = str(RefreshToken.for_user(self.user).access_token)
+        response, primary, replica = self.request(
+            'patch', f'/api/v1/profile/{self.profile.id}/', data={'language': 'Ru'},
+            content_type='application/json', HTTP_AUTHORIZATION=f'Bearer {access}')
+        assert response.status_code == 200
+        assert primary and not replica
+        assert PIN_COOKIE in response.cookies
+        # the pin cookie keeps the client on the primary until the replica has caught up
+        response, primary, replica = self.request('get', '/api/v1/profile/')
+        assert response.data['results'][0]['language'] == 'Ru'
+        assert primary and not replica
@@ -0,0 +1,77 @@
+import json
+import time
+
+from django.utils.translation import gettext_lazy as _
+from redis import RedisError
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken as BaseRefreshToken
+
+from .utils import redis_client
+
+
+GENERATION_CLAIM = 'token_generation'
+BLACKLIST_KEY = 'jwt:blacklist:{}'
+BLACKLIST_PENDING_KEY = 'jwt:blacklist:pending'
+# sorted set of the lists holding batches being copied to the database
+BLACKLIST_PROCESSING_KEY = 'jwt:blacklist:processing'
+# time of the last load_token_blacklist run; missing when Redis lost its data
+BLACKLIST_LOADED_KEY = 'jwt:blacklist:loaded'
+
+
+class RefreshToken(BaseRefreshToken):
+    """
+    Refresh token carrying the user's token generation. Bumping
+    User.token_generation revokes every token issued before the bump,
+    access tokens included, since they copy the claim from the refresh token.
+
+    Revoked JTIs live in Redis until the token expires; the token_blacklist
+    tables are filled behind by account.tasks.flush_blacklisted_tokens. The
+    tables are only read while Redis is unreachable. Tokens revoked during
+    an outage, or lost with Redis' data, are copied back into Redis by
+    account.tasks.load_token_blacklist.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[GENERATION_CLAIM] = user.token_generation
+        return token
+
+    def check_blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        try:
+            blacklisted = redis_client.exists(BLACKLIST_KEY.format(jti))
+        except RedisError:
+            # one indexed lookup on token_blacklist_outstandingtoken.jti
+            return super().check_blacklist()
+        if blacklisted:
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        jti = self.payload[api_settings.JTI_CLAIM]
+        exp = self.payload['exp']
+        ttl = exp - int(time.time())
+        if ttl <= 0:
+            return
+        record = json.dumps({
+            'jti': jti,
+            'exp': exp,
+            'token': str(self),
+            'user_id': self.payload.get(api_settings.USER_ID_CLAIM),
+        })
+        try:
+            with redis_client.pipeline() as pipe:
+                pipe.set(BLACKLIST_KEY.format(jti), 1, ex=ttl)
+                pipe.rpush(BLACKLIST_PENDING_KEY, record)
+                pipe.execute()
+        except RedisError:
+            return super().blacklist()
+
+
+def is_token_revoked(token, generation):
+    return token.get(GENERATION_CLAIM, 0) != generation
+
+
+def get_token_user_id(token):
+    return token[api_settings.USER_ID_CLAIM]
@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework_simplejwt.views import (TokenObtainPairView, TokenRefreshView)
 from rest_framework.routers import DefaultRouter
 
-from . import views
+from . import views, async_views
 
 
 router = DefaultRouter()
@@ -17,5 +17,16 @@ urlpatterns = [
     path('login/', TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path('refresh/', TokenRefreshView.as_view(), name="token_refresh"),
     path('logout/', views.APILogoutView.as_view(), name='auth_logout'),
-    path('', include(router.urls))
+    path('db-pool/', views.DatabasePoolView.as_view(), name='db_pool'),
+    path('export/', views.AccountExportView.as_view(), name='account_export'),
+    path('mentors/', views.MentorSearchView.as_view(), name='mentor_search'),
+    path('availability/', views.AvailabilityView.as_view(), name='availability'),
+    path('', include(router.urls)),
+    # native async versions, for ASGI deployments
+    path('async/register/', async_views.RegistrationView.as_view(), name='async_user_registration'),
+    path('async/activate/<str:email>/<str:activation_code>/', async_views.ActivationView.as_view(), name='async_activate'),
+    path('async/forgot-password/', async_views.ForgotPasswordView.as_view(), name='async_forgot_password'),
+    path('async/logout/', async_views.APILogoutView.as_view(), name='async_auth_logout'),
+    path('async/profile/', async_views.ProfileListView.as_view(), name='async_profile_list'),
+    path('async/profile/<int:pk>/', async_views.ProfileDetailView.as_view(), name='async_profile_detail'),
 ]
@@ -1,22 +1,58 @@
-from django.template.loader import render_to_string
-from django.utils.html import strip_tags
-from django.core.mail import send_mail
-
-
-def send_activation_code(email, activation_code):
-    context = {
-        'text_detail': 'спасибо за регистрацию',
-        'email': email,
-        'domain': 'http://0.0.0.0:8000',
-        'activation_code': activation_code
-    }
-    msg_html = render_to_string('activation.html', context)
-    message = strip_tags(msg_html)
-    send_mail(
-        'Активация аккаунта!',
-        message,
-        'romanoffnikolaus@gmail.com',
-        [email],
-        html_message=msg_html,
-        fail_silently=False
-    )
\ No newline at end of file
+import time
+import uuid
+
+import redis
+from django.conf import settings
+
+
+redis_client = redis.Redis.from_url(
+    settings.REDIS_URL,
+    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+)
+
+
+def claim_batch(queue_key, processing_key, batch_size):
+    """
+    Moves up to batch_size items from the head of a queue list into a list
+    of their own, registered in the processing_key sorted set by claim time.
+    Returns the list's key and the items; release_batch() drops the list
+    once the items are handled, requeue_stalled() puts back lists whose
+    worker never got that far.
+    """
+    key = f'{processing_key}:{uuid.uuid4().hex}'
+    with redis_client.pipeline() as pipe:
+        pipe.zadd(processing_key, {key: time.time()})
+        for _ in range(batch_size):
+            pipe.lmove(queue_key, key, 'LEFT', 'RIGHT')
+        _, *moved = pipe.execute()
+    batch = [item for item in moved if item is not None]
+    if not batch:
+        redis_client.zrem(processing_key, key)
+    return key, batch
+
+
+def release_batch(processing_key, key):
+    with redis_client.pipeline() as pipe:
+        pipe.delete(key)
+        pipe.zrem(processing_key, key)
+        pipe.execute()
+
+
+def requeue_stalled(queue_key, processing_key, timeout):
+    """
+    Puts batches claimed more than timeout seconds ago back at the head of
+    the queue, in their order. Returns the number of items put back.
+    """
+    stalled = redis_client.zrangebyscore(processing_key, '-inf', time.time() - timeout)
+    requeued = 0
+    for key in stalled:
+        # a claimed batch no longer grows, so its length is final
+        length = redis_client.llen(key)
+        with redis_client.pipeline() as pipe:
+            for _ in range(length):
+                pipe.lmove(key, queue_key, 'RIGHT', 'LEFT')
+            pipe.zrem(processing_key, key)
+            *moved, _ = pipe.execute()
+        requeued += sum(item is not None for item in moved)
+    return requeued
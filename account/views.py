@@ -1,17 +1,31 @@
-from rest_framework import generics
+from rest_framework import generics, status
+from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
-from rest_framework.permissions import IsAuthenticated
-from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import IsAuthenticated, IsAdminUser
 from django.contrib.auth import get_user_model
+from django.db import router
+from django.db.models import F, Q
+from django.http import Http404, StreamingHttpResponse
+from django.utils.http import parse_etags
 from drf_yasg.utils import swagger_auto_schema
+from redis import RedisError
+from slugify import slugify
+
+from core.db.backends.postgresql_pool.base import published_stats
+from core.db.router import ReplicaReadMixin, replica_reads
+from core.uploads import ImageUploadMixin
 from rest_framework.permissions import IsAuthenticated
 
-from . import serializers
+from . import availability, export, serializers
 from . import models
+from .cache import invalidate_user_snapshot, profile_version, get_or_build_profile
+from .changes import UPSERT, encode_cursor, profile_changes
+from .pagination import ProfileCursorPagination, RankKeysetPagination
 from .permissions import IsOwnerOrReadOnly
+from .search import search_mentors
+from .tokens import RefreshToken
 
 
 User = get_user_model()
@@ -89,9 +103,9 @@ class APILogoutView(APIView):
 
     def post(self, request, *args, **kwargs):
         if self.request.data.get('all'):
-            token: OutstandingToken
-            for token in OutstandingToken.objects.filter(user=request.user):
-                _, _ = BlacklistedToken.objects.get_or_create(token=token)
+            User.objects.filter(pk=request.user.pk).update(
+                token_generation=F('token_generation') + 1)
+            invalidate_user_snapshot(request.user.pk)
             return Response("Refresh token in backlist")
         refresh_token = self.request.data.get('refresh_token')
         token = RefreshToken(token=refresh_token)
@@ -99,7 +113,190 @@ class APILogoutView(APIView):
         return Response('Всего доброго!')
 
 
-class ProfileView(ModelViewSet):
+class ProfileView(ImageUploadMixin, ReplicaReadMixin, ModelViewSet):
     queryset = models.Profile.objects.all()
     serializer_class = serializers.ProfileSerializer
     permission_classes = [IsOwnerOrReadOnly]
+    pagination_class = ProfileCursorPagination
+    read_actions = ('list', 'retrieve')
+    # output names picked by ?fields= / ?exclude= on reads, None for all
+    fieldset = None
+    # set while building the shared retrieve cache, which holds public profiles only
+    public_only = False
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if self.action in self.read_actions:
+            serializer = serializers.ProfileFieldsetSerializer(data=request.query_params)
+            serializer.is_valid(raise_exception=True)
+            self.fieldset = serializer.validated_data['fields']
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            # hidden profiles are shown to their owner only
+            visible = Q(is_hidden=False)
+            if not self.public_only and self.request.user.is_authenticated:
+                visible |= Q(user_id=self.request.user.pk)
+            queryset = queryset.filter(visible)
+        if self.action in self.read_actions:
+            return queryset.values(*serializers.ProfileReadSerializer.values_fields(self.fieldset))
+        return queryset
+
+    def get_serializer_class(self):
+        # the schema generator needs the declared fields of the full serializer
+        if self.action in self.read_actions and not getattr(self, 'swagger_fake_view', False):
+            return serializers.ProfileReadSerializer
+        return super().get_serializer_class()
+
+    def get_serializer(self, *args, **kwargs):
+        if self.get_serializer_class() is serializers.ProfileReadSerializer:
+            kwargs['fields'] = self.fieldset
+        return super().get_serializer(*args, **kwargs)
+
+    @swagger_auto_schema(query_serializer=serializers.ProfileFieldsetSerializer)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @swagger_auto_schema(query_serializer=serializers.ProfileFieldsetSerializer)
+    def retrieve(self, request, *args, **kwargs):
+        pk = str(kwargs[self.lookup_field])
+        version = None
+        if pk.isdigit():
+            version = profile_version(int(pk), create=False)
+            # versions are started only for public profiles, so unknown ids leave no keys
+            if version is None and models.Profile.objects.filter(pk=pk, is_hidden=False).exists():
+                version = profile_version(int(pk))
+        if version is None:
+            return super().retrieve(request, *args, **kwargs)
+        etag = f'"{version}"'
+        if_none_match = [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]
+        if etag in if_none_match:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={'ETag': etag})
+        # the cache keeps the full public representation; the fieldset is cut from it
+        fieldset, self.fieldset = self.fieldset, None
+        self.public_only = True
+        try:
+            data = get_or_build_profile(
+                int(pk), version, request.get_host(),
+                lambda: dict(super(ProfileView, self).retrieve(request, *args, **kwargs).data))
+        except Http404:
+            # a hidden profile is never cached; its owner reads it from the database
+            self.fieldset, self.public_only = fieldset, False
+            return super().retrieve(request, *args, **kwargs)
+        finally:
+            self.public_only = False
+        if fieldset is not None:
+            data = {name: data[name] for name in fieldset}
+        return Response(data, headers={'ETag': etag})
+
+    @action(detail=False, methods=['get'])
+    def changes(self, request):
+        """
+        Profiles changed or deleted since the ?since= cursor, oldest first.
+        Store `next` and pass it as since on the next poll; while has_more
+        is true there are more changes waiting.
+        """
+        paginator = self.pagination_class()
+        limit = paginator.get_page_size(request)
+        changes, position, has_more = profile_changes(request.query_params.get('since'), limit)
+        results = []
+        for changed_at, kind, _, change in changes:
+            if kind == UPSERT:
+                results.append({
+                    'op': 'upsert', 'id': change.id, 'changed_at': changed_at,
+                    'profile': self.get_serializer(change).data,
+                })
+            else:
+                results.append({
+                    'op': 'delete', 'id': change.profile_id, 'user': change.user_id,
+                    'changed_at': changed_at,
+                })
+        return Response({'results': results, 'next': encode_cursor(position), 'has_more': has_more})
+
+
+class DatabasePoolView(APIView):
+    """Connection pool stats of every web and celery process using the pooled backend."""
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        try:
+            return Response(published_stats())
+        except RedisError:
+            return Response({'detail': 'Статистика пулов недоступна'}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class AccountExportView(APIView):
+    """Streams users with their profiles as CSV or JSONL, optionally gzipped."""
+    permission_classes = (IsAdminUser,)
+    content_types = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+    @swagger_auto_schema(query_serializer=serializers.AccountExportSerializer)
+    def get(self, request):
+        serializer = serializers.AccountExportSerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        # the rows are read after the view returns, so pick the database now
+        with replica_reads():
+            using = router.db_for_read(User)
+        chunks = export.export(
+            params['columns'], params['output'], params['gzip'], using=using,
+            joined_after=params.get('joined_after'), joined_before=params.get('joined_before'),
+            updated_after=params.get('updated_after'))
+        filename = f'accounts.{params["output"]}'
+        if params['gzip']:
+            filename += '.gz'
+            content_type = 'application/gzip'
+        else:
+            content_type = self.content_types[params['output']]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+
+class MentorSearchView(ReplicaReadMixin, generics.ListAPIView):
+    """Active mentors, best matches first for ?q= and ?username=, otherwise by id."""
+    serializer_class = serializers.MentorSerializer
+    pagination_class = RankKeysetPagination
+
+    @swagger_auto_schema(query_serializer=serializers.MentorSearchSerializer)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+    def get_queryset(self):
+        params = serializers.MentorSearchSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        data = params.validated_data
+        queryset = User.objects.filter(is_mentor=True, is_active=True)
+        if 'language' in data:
+            queryset = queryset.filter(profile__language=data['language'])
+        for field in ('experience', 'audience'):
+            if field in data:
+                queryset = queryset.filter(**{field: data[field]})
+        queryset = queryset.select_related('profile').only(
+            'id', 'username', 'first_name', 'last_name', 'experience', 'audience',
+            'profile__competence', 'profile__language')
+        return search_mentors(queryset, data.get('q'), data.get('username'))
+
+
+class AvailabilityView(APIView):
+    """
+    Whether ?username= and/or ?email= are still free, for registration forms.
+    Most answers come from the taken-names bloom filter without a query.
+    """
+    authentication_classes = ()
+
+    @swagger_auto_schema(query_serializer=serializers.AvailabilitySerializer)
+    def get(self, request):
+        serializer = serializers.AvailabilitySerializer(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        result = {}
+        if 'username' in data:
+            username = data['username']
+            result['username'] = not (
+                availability.is_taken('username', username)
+                or availability.is_taken('slug', slugify(username)))
+        if 'email' in data:
+            result['email'] = not availability.is_taken('email', User.objects.normalize_email(data['email']))
+        return Response(result)
@@ -0,0 +1,145 @@
+import json
+import os
+import socket
+import threading
+import time
+
+import psycopg2
+import redis
+from psycopg2 import extensions
+from django.conf import settings
+from django.db.backends.postgresql import base
+
+from core.db.pool import ConnectionPool, PoolTimeout
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+# one key per process, so pools of every web and celery process can be read
+# in one place; a key expires when its process stops publishing
+STATS_KEY = 'db:pool:stats:{}:{}'
+_publishers = set()
+_redis = None
+
+
+def _check(conn):
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    return True
+
+
+def _reset(conn):
+    if conn.closed:
+        return False
+    if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+        conn.rollback()
+    return True
+
+
+def get_pool(alias, connect):
+    # Keyed by pid as well, so a forked worker never reuses its parent's sockets.
+    key = (alias, os.getpid())
+    with _pools_lock:
+        if key not in _pools:
+            options = settings.DATABASE_POOL
+            _pools[key] = ConnectionPool(
+                connect,
+                max_size=options['MAX_SIZE'],
+                timeout=options['TIMEOUT'],
+                check_after=options['CHECK_AFTER'],
+                check=_check,
+                reset=_reset,
+            )
+            if os.getpid() not in _publishers:
+                _publishers.add(os.getpid())
+                threading.Thread(target=_publish_forever, name='db-pool-stats', daemon=True).start()
+        return _pools[key]
+
+
+def pool_stats():
+    pid = os.getpid()
+    return {alias: pool.stats() for (alias, pool_pid), pool in _pools.items() if pool_pid == pid}
+
+
+def _get_redis():
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(
+            settings.REDIS_URL,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+        )
+    return _redis
+
+
+def publish_stats():
+    """Stores this process's pool stats in Redis for STATS_INTERVAL * 3 seconds."""
+    interval = settings.DATABASE_POOL['STATS_INTERVAL']
+    record = {'host': socket.gethostname(), 'pid': os.getpid(), 'pools': pool_stats()}
+    _get_redis().set(STATS_KEY.format(record['host'], record['pid']), json.dumps(record), ex=int(interval * 3))
+
+
+def _publish_forever():
+    while True:
+        try:
+            publish_stats()
+        except redis.RedisError:
+            pass
+        time.sleep(settings.DATABASE_POOL['STATS_INTERVAL'])
+
+
+def published_stats():
+    """
+    Pool stats of every process that published recently: each process as
+    published, and totals per database alias over all of them.
+    """
+    client = _get_redis()
+    keys = list(client.scan_iter(match=STATS_KEY.format('*', '*'), count=1000))
+    processes = sorted(
+        (json.loads(record) for record in client.mget(keys) if record is not None) if keys else [],
+        key=lambda record: (record['host'], record['pid']))
+    totals = {}
+    for record in processes:
+        for alias, stats in record['pools'].items():
+            total = totals.setdefault(alias, {
+                'processes': 0, 'max_size': 0, 'in_use': 0, 'idle': 0, 'created': 0,
+                'discarded': 0, 'checkouts': 0, 'timeouts': 0, 'wait_ms': 0.0, 'max_wait_ms': 0.0,
+            })
+            total['processes'] += 1
+            for name in ('max_size', 'in_use', 'idle', 'created', 'discarded', 'checkouts', 'timeouts'):
+                total[name] += stats[name]
+            total['wait_ms'] += stats['avg_wait_ms'] * stats['checkouts']
+            total['max_wait_ms'] = max(total['max_wait_ms'], stats['max_wait_ms'])
+    for total in totals.values():
+        total['saturation'] = total['in_use'] / total['max_size'] if total['max_size'] else 0.0
+        wait_ms = total.pop('wait_ms')
+        total['avg_wait_ms'] = wait_ms / total['checkouts'] if total['checkouts'] else 0.0
+    return {'totals': totals, 'processes': processes}
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend that takes connections from a process-local pool and
+    gives them back on close(), for Celery workers and ASGI where Django's
+    per-thread persistent connections are not reused well.
+    Use it with CONN_MAX_AGE = 0 so connections return to the pool after
+    every request and task.
+    """
+
+    def get_new_connection(self, conn_params):
+        pool = get_pool(self.alias, lambda: super(DatabaseWrapper, self).get_new_connection(conn_params))
+        try:
+            connection = pool.getconn()
+        except PoolTimeout as e:
+            raise psycopg2.OperationalError(str(e)) from e
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None:
+            return
+        pool = _pools.get((self.alias, os.getpid()))
+        if pool is None:
+            return super()._close()
+        pool.putconn(self.connection)
@@ -0,0 +1,122 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of DB-API connections bounded by `max_size`.
+
+    `connect` opens a new connection, `check` tells whether a connection that
+    sat idle for longer than `check_after` seconds is still alive, and `reset`
+    prepares a returned connection for reuse (returning False discards it).
+    """
+
+    def __init__(self, connect, max_size, timeout, check_after=30, check=None, reset=None):
+        self._connect = connect
+        self._check = check or (lambda conn: True)
+        self._reset = reset or (lambda conn: True)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.discarded = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    def getconn(self):
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.timeouts += 1
+            raise PoolTimeout(f'No database connection available within {self.timeout}s')
+        waited = time.monotonic() - started
+        try:
+            conn = self._pop_idle() or self._new()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            self.wait_time += waited
+            self.max_wait = max(self.max_wait, waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        try:
+            if discard or not self._safe(self._reset, conn):
+                self._discard(conn)
+            else:
+                with self._lock:
+                    self._idle.append((conn, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'in_use': self.in_use,
+                'idle': len(self._idle),
+                'peak_in_use': self.peak_in_use,
+                'saturation': self.in_use / self.max_size,
+                'created': self.created,
+                'discarded': self.discarded,
+                'checkouts': self.checkouts,
+                'timeouts': self.timeouts,
+                'avg_wait_ms': self.wait_time / self.checkouts * 1000 if self.checkouts else 0.0,
+                'max_wait_ms': self.max_wait * 1000,
+            }
+
+    def _pop_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                # LIFO: the most recently used connection is the least likely to be stale
+                conn, returned_at = self._idle.pop()
+            if time.monotonic() - returned_at < self.check_after or self._safe(self._check, conn):
+                return conn
+            self._discard(conn)
+
+    def _new(self):
+        conn = self._connect()
+        with self._lock:
+            self.created += 1
+        return conn
+
+    def _discard(self, conn):
+        with self._lock:
+            self.discarded += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @staticmethod
+    def _safe(func, conn):
+        try:
+            return func(conn)
+        except Exception:
+            return False
@@ -0,0 +1,130 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+
+REPLICA_ALIAS = 'replica'
+PIN_COOKIE = 'pin_primary'
+
+_use_replica = contextvars.ContextVar('use_replica', default=False)
+_pinned = contextvars.ContextVar('pinned_to_primary', default=False)
+_wrote = contextvars.ContextVar('wrote_to_primary', default=False)
+_replica_state = {'checked_at': float('-inf'), 'healthy': True}
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Lets reads inside the block go to the replica unless the request already
+    wrote; replica_reads(False) sends them to the primary again.
+    """
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def replica_lag():
+    connection = connections[REPLICA_ALIAS]
+    if connection.vendor != 'postgresql':
+        return 0.0
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+            "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+        )
+        return float(cursor.fetchone()[0])
+
+
+def replica_available():
+    if REPLICA_ALIAS not in settings.DATABASES:
+        return False
+    now = time.monotonic()
+    if now - _replica_state['checked_at'] >= settings.REPLICA_LAG_CHECK_INTERVAL:
+        try:
+            healthy = replica_lag() <= settings.REPLICA_MAX_LAG
+        except DatabaseError:
+            healthy = False
+        _replica_state.update(checked_at=now, healthy=healthy)
+    return _replica_state['healthy']
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends reads made inside replica_reads() to the replica while it is within
+    REPLICA_MAX_LAG seconds of the primary. Any write pins the rest of the
+    request to the primary, and ReplicaRoutingMiddleware keeps the client
+    pinned for REPLICA_MAX_LAG seconds, so clients read their own writes.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and not _pinned.get() and replica_available():
+            return REPLICA_ALIAS
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _pinned.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        # under ASGI the chain stays async, so async views do not hold a thread
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        pinned_token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote_token = _wrote.set(False)
+        try:
+            response = self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+        return self.process_response(response, wrote)
+
+    async def __acall__(self, request):
+        pinned_token = _pinned.set(PIN_COOKIE in request.COOKIES)
+        wrote_token = _wrote.set(False)
+        try:
+            response = await self.get_response(request)
+            wrote = _wrote.get()
+        finally:
+            _pinned.reset(pinned_token)
+            _wrote.reset(wrote_token)
+        return self.process_response(response, wrote)
+
+    def process_response(self, response, wrote):
+        if wrote:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_MAX_LAG, httponly=True)
+        return response
+
+
+class ReplicaReadMixin:
+    """View mixin serving safe-method requests from the replica."""
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in SAFE_METHODS:
+            return super().dispatch(request, *args, **kwargs)
+        with replica_reads():
+            return super().dispatch(request, *args, **kwargs)
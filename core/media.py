@@ -0,0 +1,27 @@
+import mimetypes
+import posixpath
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_cache_control
+from django.views import static
+
+
+def serve(request, path):
+    """
+    Media files. Behind nginx (MEDIA_X_ACCEL_REDIRECT) the response only
+    names the file and nginx sends it from its internal location; otherwise
+    Django serves it, which is meant for development. Stored names never
+    change content, since storage picks a new name for every upload, so
+    responses are cacheable for MEDIA_CACHE_MAX_AGE.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if path.startswith('..') or path in ('', '.'):
+        raise Http404
+    if settings.MEDIA_X_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        response['X-Accel-Redirect'] = f'{settings.MEDIA_X_ACCEL_PREFIX}{path}'
+    else:
+        response = static.serve(request, path, document_root=settings.MEDIA_ROOT)
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True)
+    return response
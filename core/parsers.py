@@ -0,0 +1,25 @@
+import orjson
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+
+from core.renderers import ORJSONRenderer
+
+
+def loads(body, encoding='utf-8'):
+    """orjson.loads for a request body; orjson itself only reads UTF-8."""
+    try:
+        if encoding.lower().replace('_', '-') not in ('utf-8', 'utf8'):
+            body = body.decode(encoding)
+        return orjson.loads(body)
+    except (ValueError, LookupError) as exc:
+        raise ParseError(f'JSON parse error - {exc}')
+
+
+class ORJSONParser(JSONParser):
+    """JSONParser on orjson. Like DRF's strict mode it rejects NaN and Infinity."""
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        return loads(stream.read(), parser_context.get('encoding', settings.DEFAULT_CHARSET))
@@ -1,6 +1,8 @@
+import os
 from pathlib import Path
 from decouple import config
 from datetime import timedelta
+from celery.schedules import crontab
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -28,6 +30,7 @@ INSTALLED_APPS = [
     "django.contrib.sessions",
     "django.contrib.messages",
     "django.contrib.staticfiles",
+    "django.contrib.postgres",
     #modules
     'rest_framework',
     'rest_framework_simplejwt',
@@ -38,6 +41,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # first, so it compresses what every other middleware produced
+    "core.compression.CompressionMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -45,6 +50,7 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "core.db.router.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "core.urls"
@@ -71,17 +77,49 @@ WSGI_APPLICATION = "core.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# DB_ENGINE=core.db.backends.postgresql_pool (with CONN_MAX_AGE=0) gives
+# celery workers and ASGI a process-local connection pool instead of
+# persistent per-thread connections.
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': config('DB_ENGINE', default='django.db.backends.postgresql'),
         'NAME': config('POSTGRES_DB'),
         'USER': config('POSTGRES_USER'),
         'PASSWORD': config('POSTGRES_PASSWORD'),
         'HOST': config('POSTGRES_HOST'),
         'PORT': config('POSTGRES_PORT'),
+        'CONN_MAX_AGE': config('CONN_MAX_AGE', default=60, cast=int),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# optional streaming replica; safe reads of views using
+# core.db.router.ReplicaReadMixin are served from it
+if config('POSTGRES_REPLICA_HOST', default=''):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': config('POSTGRES_REPLICA_HOST'),
+        'PORT': config('POSTGRES_REPLICA_PORT', default=config('POSTGRES_PORT')),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['core.db.router.PrimaryReplicaRouter']
+# seconds; the replica is skipped while it lags more, and clients that wrote
+# read from the primary for this long
+REPLICA_MAX_LAG = 5
+REPLICA_LAG_CHECK_INTERVAL = 5
+
+DATABASE_POOL = {
+    'MAX_SIZE': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+    # seconds to wait for a free connection before failing
+    'TIMEOUT': config('DB_POOL_TIMEOUT', default=5, cast=float),
+    # idle connections older than this are pinged before reuse
+    'CHECK_AFTER': 30,
+    # seconds between the stats each pooled process publishes to Redis
+    # for /api/v1/db-pool/
+    'STATS_INTERVAL': 10,
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -102,6 +140,47 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 
+AUTHENTICATION_BACKENDS = ['account.backends.HashingPoolBackend']
+
+# The first hasher hashes new passwords; hashes made by the others, or with
+# a different cost, are rehashed on the next login. PASSWORD_HASHER picks
+# argon2 (Argon2id) or scrypt.
+PASSWORD_HASHER = config('PASSWORD_HASHER', default='argon2')
+PASSWORD_HASHERS = [
+    'account.hashers.Argon2PasswordHasher',
+    'account.hashers.ScryptPasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+if PASSWORD_HASHER == 'scrypt':
+    PASSWORD_HASHERS.insert(0, PASSWORD_HASHERS.pop(1))
+ARGON2_TIME_COST = config('ARGON2_TIME_COST', default=2, cast=int)
+ARGON2_MEMORY_COST = config('ARGON2_MEMORY_COST', default=65536, cast=int)  # KiB
+ARGON2_PARALLELISM = config('ARGON2_PARALLELISM', default=1, cast=int)
+SCRYPT_WORK_FACTOR = config('SCRYPT_WORK_FACTOR', default=2 ** 15, cast=int)
+SCRYPT_BLOCK_SIZE = config('SCRYPT_BLOCK_SIZE', default=8, cast=int)
+SCRYPT_PARALLELISM = config('SCRYPT_PARALLELISM', default=1, cast=int)
+
+# Passwords are hashed in a pool of worker processes, 0 hashes in the caller.
+# At most PASSWORD_HASHING_MAX_PENDING hashes queue up; further callers wait
+# PASSWORD_HASHING_QUEUE_TIMEOUT seconds for a slot and then get a 503.
+#
+# Memory budget: every gunicorn worker and celery worker process starts its
+# own pool, and every running hash takes ARGON2_MEMORY_COST KiB (64 MiB by
+# default; scrypt takes 128 * SCRYPT_BLOCK_SIZE * SCRYPT_WORK_FACTOR bytes,
+# 32 MiB). At peak a host needs
+#   processes * PASSWORD_HASHING_WORKERS * ARGON2_MEMORY_COST
+# on top of the interpreters the pools start, e.g. 4 gunicorn workers * 2 *
+# 64 MiB = 512 MiB. Hence the default of at most 2 per process; raise it only
+# with fewer processes per host, keeping the product near the CPU count.
+PASSWORD_HASHING_WORKERS = config('PASSWORD_HASHING_WORKERS', default=min(os.cpu_count() or 1, 2), cast=int)
+# spawn or forkserver; fork would copy the parent's threads and connections
+PASSWORD_HASHING_START_METHOD = config('PASSWORD_HASHING_START_METHOD', default='spawn')
+PASSWORD_HASHING_MAX_PENDING = config(
+    'PASSWORD_HASHING_MAX_PENDING', default=4 * max(PASSWORD_HASHING_WORKERS, 1), cast=int)
+PASSWORD_HASHING_QUEUE_TIMEOUT = config('PASSWORD_HASHING_QUEUE_TIMEOUT', default=1.0, cast=float)
+
+
 # Internationalization
 # https://docs.djangoproject.com/en/4.1/topics/i18n/
 
@@ -127,9 +206,23 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'account.authentication.CachedJWTAuthentication',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'core.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'core.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
+# responses smaller than this are sent uncompressed; brotli (pinned in
+# requirements.txt) is used when the client accepts it, gzip otherwise.
+# Installs without the brotli package fall back to gzip only
+COMPRESSION_MIN_SIZE = 1024
+COMPRESSION_BROTLI_QUALITY = 5
 
 # email.backend settings
 EMAIL_BACKEND = config('EMAIL_BACKEND')
@@ -138,18 +231,112 @@ EMAIL_PORT = config('EMAIL_PORT')
 EMAIL_USE_TLS = config('EMAIL_USE_TLS')
 EMAIL_HOST_USER = config('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
+EMAIL_BATCH_SIZE = 50
+EMAIL_MAX_RETRIES = 5
+# seconds; doubled on every further attempt
+EMAIL_RETRY_BACKOFF = 30
+EMAIL_HEALTHCHECK_INTERVAL = 30
+# seconds after which a batch claimed by a worker that never finished it
+# is queued again; mail in it may then be sent twice, never lost
+EMAIL_PROCESSING_TIMEOUT = 15 * 60
 
 # JWTtoken settings
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=100000),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),
     'ROTATE_REFRESH_TOKENS': True,
-    'BLACKLIST_AFTER_ROTATION': True 
+    'BLACKLIST_AFTER_ROTATION': True,
+    'TOKEN_OBTAIN_SERIALIZER': 'account.serializers.TokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'account.serializers.TokenRefreshSerializer',
     }
 
 # celery settings
 CELERY_BROKER_URL = "redis://redis:6379/0"
 CELERY_RESULT_BACKEND = "redis://redis:6379/0"
+OUTBOX_BATCH_SIZE = 500
+# rows fetched per round trip by account exports
+EXPORT_CHUNK_SIZE = 2000
+# bloom filter of taken usernames, emails and slugs behind the availability check:
+# account.availability.RedisBloomFilter (shared) or LocalBloomFilter (per process)
+AVAILABILITY_FILTER = 'account.availability.RedisBloomFilter'
+AVAILABILITY_FILTER_CAPACITY = config('AVAILABILITY_FILTER_CAPACITY', default=3_000_000, cast=int)
+AVAILABILITY_FILTER_ERROR_RATE = 0.01
+# text search configuration for the mentor directory; simple does no stemming,
+# so Russian, Kyrgyz and English names and competences match as typed
+SEARCH_CONFIG = 'simple'
+# profile change feed: seconds held back for late commits and replica lag,
+# and how long deletions are kept (older cursors must resync)
+PROFILE_CHANGES_SETTLE = REPLICA_MAX_LAG + 2
+PROFILE_TOMBSTONE_TTL = timedelta(days=30)
+CELERY_BEAT_SCHEDULE = {
+    'load-token-blacklist': {
+        'task': 'account.tasks.load_token_blacklist',
+        'schedule': 30.0,
+    },
+    'flush-blacklisted-tokens': {
+        'task': 'account.tasks.flush_blacklisted_tokens',
+        'schedule': 10.0,
+    },
+    'expire-password-reset-codes': {
+        'task': 'account.tasks.expire_password_reset_codes',
+        'schedule': 30.0,
+    },
+    'retry-failed-mail': {
+        'task': 'account.tasks.retry_failed_mail',
+        'schedule': 30.0,
+    },
+    'prune-expired-tokens': {
+        'task': 'account.tasks.prune_expired_tokens',
+        'schedule': crontab(minute=0),
+    },
+    'rebuild-availability-filter': {
+        'task': 'account.tasks.rebuild_availability_filter',
+        'schedule': crontab(minute=0, hour=4),
+    },
+    'prune-profile-tombstones': {
+        'task': 'account.tasks.prune_profile_tombstones',
+        'schedule': crontab(minute=30, hour=3),
+    },
+}
+
+PASSWORD_RESET_CODE_TTL = timedelta(minutes=2)
+# where password reset codes live: account.codes.RedisCodeStore or DatabaseCodeStore
+ACCOUNT_CODE_STORE = 'account.codes.RedisCodeStore'
+ACCOUNT_CODE_TTLS = {
+    'reset': PASSWORD_RESET_CODE_TTL,
+}
+
+# redis (token blacklist and other short-lived state)
+REDIS_URL = config('REDIS_URL', default='redis://redis:6379/1')
+REDIS_SOCKET_TIMEOUT = 0.5
+TOKEN_BLACKLIST_BATCH_SIZE = 1000
+# seconds after which a batch flush_blacklisted_tokens claimed but never
+# committed is queued again
+TOKEN_BLACKLIST_PROCESSING_TIMEOUT = 5 * 60
+# load_token_blacklist rereads tokens blacklisted this long before its last
+# run, for database blacklistings that committed late
+TOKEN_BLACKLIST_RELOAD_OVERLAP = timedelta(minutes=1)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+        'KEY_PREFIX': 'cache',
+        'OPTIONS': {
+            'socket_connect_timeout': REDIS_SOCKET_TIMEOUT,
+            'socket_timeout': REDIS_SOCKET_TIMEOUT,
+        },
+    }
+}
+# public profile representations: seconds to keep / to wait for a concurrent rebuild
+PROFILE_CACHE_TTL = 600
+PROFILE_CACHE_LOCK_TIMEOUT = 2
+# seconds a profile version (its ETag) is kept; an expired one is replaced,
+# which only costs clients one full response
+PROFILE_VERSION_TTL = 60 * 60 * 24
+# authenticated user snapshots: seconds in Redis / in process memory
+USER_CACHE_TTL = 60
+USER_CACHE_LOCAL_TTL = 5
+USER_CACHE_LOCAL_SIZE = 10000
 
 # logging
 LOGGING = {
@@ -174,6 +361,20 @@ LOGGING = {
 # media
 MEDIA_URL = 'media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+# behind nginx media responses only carry X-Accel-Redirect to its internal location
+MEDIA_X_ACCEL_REDIRECT = config('MEDIA_X_ACCEL_REDIRECT', default=not DEBUG, cast=bool)
+MEDIA_X_ACCEL_PREFIX = '/protected-media/'
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+# uploaded files stream to a temporary file and are rejected while being
+# received once larger than this (keep nginx client_max_body_size above it)
+UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+# profile image variants built by celery: square side in pixels per variant,
+# encoded in every format; uploads above AVATAR_MAX_PIXELS are not decoded
+AVATAR_VARIANTS = {'small': 64, 'medium': 200, 'large': 512}
+AVATAR_FORMATS = ('webp', 'jpeg')
+AVATAR_QUALITY = 80
+AVATAR_MAX_PIXELS = 40_000_000
+AVATAR_VARIANTS_DIR = 'avatars'
 # static
 STATIC_URL = 'static/'
 STATIC_ROOT = BASE_DIR / 'static'
\ No newline at end of file
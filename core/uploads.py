@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+
+# leading bytes of the formats Pillow decodes for profile images
+IMAGE_SIGNATURES = (
+    (0, b'\xff\xd8\xff'),                  # JPEG
+    (0, b'\x89PNG\r\n\x1a\n'),             # PNG
+    (0, b'GIF87a'),
+    (0, b'GIF89a'),
+    (8, b'WEBP'),                          # RIFF....WEBP
+)
+SNIFF_SIZE = 12
+
+
+class UploadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Файл слишком большой'
+    default_code = 'upload_too_large'
+
+
+class UnsupportedUpload(APIException):
+    status_code = status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    default_detail = 'Можно загрузить только изображение JPEG, PNG, GIF или WebP'
+    default_code = 'unsupported_upload'
+
+
+def is_image(head):
+    return any(head[offset:offset + len(signature)] == signature
+               for offset, signature in IMAGE_SIGNATURES)
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Streams every uploaded file to a temporary file, never into memory, and
+    aborts the request as soon as a file outgrows UPLOAD_MAX_SIZE or its
+    first bytes are not an image. A Content-Length that cannot fit is
+    rejected before the body is read.
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+        # other form fields are capped by DATA_UPLOAD_MAX_MEMORY_SIZE
+        limit = settings.UPLOAD_MAX_SIZE + (settings.DATA_UPLOAD_MAX_MEMORY_SIZE or 0)
+        if content_length > limit:
+            raise UploadTooLarge()
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+        self.head = b''
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.UPLOAD_MAX_SIZE:
+            raise UploadTooLarge()
+        if self.head is not None:
+            self.head += raw_data[:SNIFF_SIZE]
+            if len(self.head) >= SNIFF_SIZE:
+                self.sniff()
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        if self.head is not None:
+            self.sniff()
+        return super().file_complete(file_size)
+
+    def sniff(self):
+        if not is_image(self.head):
+            self.file.close()
+            raise UnsupportedUpload()
+        self.head = None
+
+
+class ImageUploadMixin:
+    """View mixin parsing multipart uploads with ImageUploadHandler."""
+
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers = [ImageUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
@@ -1,10 +1,12 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf.urls.static import static
 from django.conf import settings
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from core import media
+
 schema_view = get_schema_view(
     openapi.Info(
         title='Lab',
@@ -22,4 +24,4 @@ urlpatterns = [
 
 
 urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+urlpatterns += [re_path(rf'^{settings.MEDIA_URL.lstrip("/")}(?P<path>.+)$', media.serve)]